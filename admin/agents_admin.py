@@ -5,12 +5,13 @@ resuming agents, and managing their pricing.
 """
 
 import logging
+from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
 
 from services.agent_service import (
     create_agent, list_agents, update_agent_status, 
-    update_agent_pricing, get_agent_by_id
+    update_agent_pricing, get_agent_by_id, invalidate_agent_cache
 )
 from services.tenant import get_tenant_string
 from services.message_utils import safe_edit_message_text
@@ -97,6 +98,13 @@ def t_admin(lang: str, key: str, **kwargs) -> str:
     return render_text(lang, key, ADMIN_I18N, **kwargs)
 
 
+def _format_created_at(value) -> str:
+    """Format an agent's created_at; older documents may hold a string."""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value) if value else 'N/A'
+
+
 def agent_create_command(update: Update, context: CallbackContext):
     """Handle /agent_create command to create a new agent.
     
@@ -195,7 +203,7 @@ def agent_list_command(update: Update, context: CallbackContext):
                 f"  • Status: {status}\n"
                 f"  • Markup: {markup_value}"
                 f"{'%' if markup_type == MARKUP_TYPE_PERCENT else ' USDT'}\n"
-                f"  • Created: {agent.get('created_at', 'N/A')}\n\n"
+                f"  • Created: {_format_created_at(agent.get('created_at'))}\n\n"
             )
         
         update.message.reply_text(text, parse_mode='HTML')
@@ -457,7 +465,7 @@ def agent_detail_callback(update: Update, context: CallbackContext):
 
 <b>{t_admin(lang, 'agent_id')}:</b> <code>{agent_id}</code>
 <b>{t_admin(lang, 'status')}:</b> {status_text}
-<b>{t_admin(lang, 'created')}:</b> {agent.get('created_at', 'N/A')}
+<b>{t_admin(lang, 'created')}:</b> {_format_created_at(agent.get('created_at'))}
 
 <b>{t_admin(lang, 'management_options')}:</b>"""
         
@@ -816,6 +824,7 @@ def admin_setting_text_input(update: Update, context: CallbackContext):
                     "$unset": {f"settings.{field}": ""}
                 }
             )
+            invalidate_agent_cache(agent_id)
             
             context.user_data.pop("admin_setting_flow", None)
             update.message.reply_text(f"✅ {field_name}已清除")
@@ -864,6 +873,7 @@ def admin_setting_text_input(update: Update, context: CallbackContext):
                 }
             }
         )
+        invalidate_agent_cache(agent_id)
         
         context.user_data.pop("admin_setting_flow", None)
         update.message.reply_text(
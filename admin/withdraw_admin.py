@@ -38,7 +38,7 @@ def withdraw_list_command(update: Update, context: CallbackContext):
             return
         
         withdrawals_collection = bot_db['agent_withdrawals']
-        withdrawals = list_withdrawals(withdrawals_collection, status=status)
+        withdrawals = list_withdrawals(withdrawals_collection, status=status, limit=20)
         
         if not withdrawals:
             update.message.reply_text(f"No withdrawals with status '{status}'")
@@ -46,7 +46,7 @@ def withdraw_list_command(update: Update, context: CallbackContext):
         
         text = f"<b>💰 Withdrawal Requests ({status})</b>\n\n"
         
-        for w in withdrawals[:20]:  # Limit to first 20
+        for w in withdrawals:  # First 20 only
             agent_id = w['agent_id']
             amount = w['amount']
             wallet = w['wallet_address']
@@ -66,8 +66,10 @@ def withdraw_list_command(update: Update, context: CallbackContext):
             
             text += "\n"
         
-        if len(withdrawals) > 20:
-            text += f"\n... and {len(withdrawals) - 20} more"
+        if len(withdrawals) == 20:
+            total = withdrawals_collection.count_documents({'status': status})
+            if total > 20:
+                text += f"\n... and {total - 20} more"
         
         update.message.reply_text(text, parse_mode='HTML')
         
@@ -273,7 +275,7 @@ def withdraw_view_callback(update: Update, context: CallbackContext):
         status = query.data.split('_')[-1]  # e.g., "withdraw_view_requested" -> "requested"
         
         withdrawals_collection = bot_db['agent_withdrawals']
-        withdrawals = list_withdrawals(withdrawals_collection, status=status)
+        withdrawals = list_withdrawals(withdrawals_collection, status=status, limit=10)
         
         if not withdrawals:
             query.edit_message_text(
@@ -285,7 +287,7 @@ def withdraw_view_callback(update: Update, context: CallbackContext):
         text = f"<b>💰 {status.title()} Withdrawals</b>\n\n"
         keyboard = []
         
-        for w in withdrawals[:10]:  # Limit to 10
+        for w in withdrawals:  # Limited to 10
             agent_id = w['agent_id']
             amount = w['amount']
             requested_at = w['requested_at'].strftime('%m-%d %H:%M')
@@ -17,7 +17,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Import services
-from services.agent_service import get_active_agents, get_agent_bot_token
+from services.agent_service import (
+    get_active_agents, get_agent_bot_token, get_agent_bot_tokens
+)
 from services.tenant import get_tenant_string
 
 # Import mongo for database access
@@ -55,20 +57,22 @@ def register_handlers_for_agent(dispatcher: Dispatcher, agent_id: str, agent_doc
     # - context.bot_data["agent_id"] = agent_id
 
 
-def start_agent_bot(agent_id: str, agent_doc: dict) -> bool:
+def start_agent_bot(agent_id: str, agent_doc: dict, bot_token: str = None) -> bool:
     """Start a bot instance for an agent.
     
     Args:
         agent_id: Agent identifier.
         agent_doc: Agent document from database.
+        bot_token: Optional already-decrypted bot token (looked up if omitted).
     
     Returns:
         bool: True if started successfully.
     """
     try:
         # Get decrypted bot token
-        agents_collection = bot_db['agents']
-        bot_token = get_agent_bot_token(agents_collection, agent_id)
+        if not bot_token:
+            agents_collection = bot_db['agents']
+            bot_token = get_agent_bot_token(agents_collection, agent_id)
         
         if not bot_token:
             logging.error(f"Failed to get bot token for agent {agent_id}")
@@ -183,6 +187,11 @@ def discover_and_start_agents():
         
         logging.info(f"Found {len(active_agents)} active agents")
         
+        # Fetch and decrypt all tokens in a single query
+        bot_tokens = get_agent_bot_tokens(
+            agents_collection, [a['agent_id'] for a in active_agents]
+        )
+        
         for agent_doc in active_agents:
             agent_id = agent_doc['agent_id']
             
@@ -193,7 +202,7 @@ def discover_and_start_agents():
                     continue
             
             # Start the agent bot
-            start_agent_bot(agent_id, agent_doc)
+            start_agent_bot(agent_id, agent_doc, bot_tokens.get(agent_id))
             
             # Small delay between starts to avoid overwhelming the system
             time.sleep(1)
@@ -223,13 +232,18 @@ def monitor_agents_loop():
                 running_agent_ids = set(running_agents.keys())
             
             # Start agents that should be running but aren't
-            for agent_doc in active_agents:
+            stopped_agents = [
+                a for a in active_agents if a['agent_id'] not in running_agent_ids
+            ]
+            bot_tokens = get_agent_bot_tokens(
+                agents_collection, [a['agent_id'] for a in stopped_agents]
+            )
+            for agent_doc in stopped_agents:
                 agent_id = agent_doc['agent_id']
-                if agent_id not in running_agent_ids:
-                    logging.warning(
-                        f"Agent {agent_id} should be running but isn't, restarting..."
-                    )
-                    start_agent_bot(agent_id, agent_doc)
+                logging.warning(
+                    f"Agent {agent_id} should be running but isn't, restarting..."
+                )
+                start_agent_bot(agent_id, agent_doc, bot_tokens.get(agent_id))
             
             # Stop agents that are running but shouldn't be
             for agent_id in running_agent_ids:
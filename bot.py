@@ -70,6 +70,7 @@ from pymongo import MongoClient
 from mongo import *
 from mongo import topup, user
 from utils import create_easypay_url, create_payment_with_qrcode
+from services.message_utils import safe_send_html, safe_send_html_many
 from pay_server import start_flask_server
 from bot_links import (
     get_links_for_child_agent,
@@ -1465,7 +1466,7 @@ def show_admin_panel(update: Update, context: CallbackContext, user_id: int):
     month_rmb = sum_rmb(month_start, now)
     month_usdt = sum_usdt(month_start, now)
 
-    total_users = user.count_documents({})
+    total_users = user.estimated_document_count()
     total_balance = sum(i.get('USDT', 0) for i in user.find({'USDT': {'$gt': 0}}))
 
     # ✅ 美化管理员控制台，使用树状结构
@@ -1997,7 +1998,7 @@ def stock_alerts(update: Update, context: CallbackContext):
     normal_stock_items = []
     
     # 如果hb集合为空，显示提示信息
-    total_hb_count = hb.count_documents({})
+    total_hb_count = hb.estimated_document_count()
     
     if total_hb_count == 0:
         text = """
@@ -2607,7 +2608,7 @@ def multilang_management(update: Update, context: CallbackContext):
         return
 
     # 获取翻译统计
-    total_translations = fyb.count_documents({})
+    total_translations = fyb.estimated_document_count()
     
     # 获取最近翻译
     recent_translations = list(fyb.find({}).sort('_id', -1).limit(5))
@@ -2686,7 +2687,7 @@ def translation_dictionary(update: Update, context: CallbackContext):
     skip = (page - 1) * per_page
     
     translations = list(fyb.find({}).sort('_id', -1).skip(skip).limit(per_page))
-    total_count = fyb.count_documents({})
+    total_count = fyb.estimated_document_count()
     total_pages = (total_count + per_page - 1) // per_page
 
     text = f"""
@@ -2758,7 +2759,7 @@ def language_statistics(update: Update, context: CallbackContext):
     ]
     
     language_stats = list(fyb.aggregate(pipeline))
-    total_translations = fyb.count_documents({})
+    total_translations = fyb.estimated_document_count()
     
     # 统计最活跃翻译时间段
     recent_24h = datetime.now() - timedelta(hours=24)
@@ -3155,7 +3156,7 @@ def clear_translation_cache(update: Update, context: CallbackContext):
 
     try:
         # 获取缓存统计
-        total_cache = fyb.count_documents({})
+        total_cache = fyb.estimated_document_count()
         
         text = f"""
 🗑️ <b>清理翻译缓存</b>
@@ -3329,7 +3330,7 @@ def detailed_lang_report(update: Update, context: CallbackContext):
         ]
         
         stats = list(fyb.aggregate(pipeline))
-        total_translations = fyb.count_documents({})
+        total_translations = fyb.estimated_document_count()
 
         text = f"""
 📈 <b>详细语言统计报表</b>
@@ -3484,7 +3485,7 @@ def clear_expired_cache(update: Update, context: CallbackContext):
         cutoff_date = datetime.now() - timedelta(days=30)
         
         # 获取过期记录数量（这里简化处理，实际应根据具体的时间戳字段）
-        total_before = fyb.count_documents({})
+        total_before = fyb.estimated_document_count()
         
         # 模拟清理操作（实际使用时应该根据真实的时间字段进行删除）
         # deleted_count = fyb.delete_many({"created_at": {"$lt": cutoff_date}}).deleted_count
@@ -3541,7 +3542,7 @@ def clear_lowfreq_cache(update: Update, context: CallbackContext):
     user_id = query.from_user.id
 
     try:
-        total_before = fyb.count_documents({})
+        total_before = fyb.estimated_document_count()
         
         # 模拟清理低频缓存（实际应该根据使用频率字段）
         deleted_count = max(0, int(total_before * 0.05))  # 模拟清理5%的低频数据
@@ -3645,7 +3646,7 @@ def confirm_clear_all_cache(update: Update, context: CallbackContext):
     user_id = query.from_user.id
 
     try:
-        total_before = fyb.count_documents({})
+        total_before = fyb.estimated_document_count()
         
         # 实际清理操作（谨慎使用）
         # fyb.delete_many({})
@@ -4775,7 +4776,7 @@ def backstart(update: Update, context: CallbackContext):
     month_rmb = sum_rmb(month_start, now)
     month_usdt = sum_usdt(month_start, now)
 
-    total_users = user.count_documents({})
+    total_users = user.estimated_document_count()
     total_balance = sum(i.get('USDT', 0) for i in user.find({'USDT': {'$gt': 0}}))
 
     # ✅ 美化管理员控制台，使用树状结构
@@ -5279,7 +5280,7 @@ def show_user_list(update: Update, context: CallbackContext, page=0):
     user_id = query.from_user.id
 
     limit = 30
-    total = user.count_documents({})
+    total = user.estimated_document_count()
     total_pages = (total + limit - 1) // limit
     current_page = max(0, min(page, total_pages - 1))
 
@@ -6448,7 +6449,7 @@ def trc20_pending_stats(update: Update, context: CallbackContext):
         from datetime import datetime, timedelta
         yesterday = datetime.now() - timedelta(days=1)
         completed_count = topup.count_documents({
-            'status': 'completed',
+            'status': 'success',
             'cz_type': 'usdt',
             'credited_at': {'$gte': yesterday}
         })
@@ -9563,7 +9564,8 @@ def textkeyboard(update: Update, context: CallbackContext):
 
             elif text == '中文服务':
                 del_message(update.message)
-                user.update_one({'user_id': user_id}, {"$set": {'lang': 'zh'}})
+                from services.i18n_utils import set_user_locale
+                set_user_locale(user_id, 'zh')
                 lang = 'zh'
 
                 keyboard = [[] for _ in range(100)]
@@ -9587,7 +9589,8 @@ def textkeyboard(update: Update, context: CallbackContext):
 
             elif text == 'English':
                 del_message(update.message)
-                user.update_one({'user_id': user_id}, {"$set": {'lang': 'en'}})
+                from services.i18n_utils import set_user_locale
+                set_user_locale(user_id, 'en')
                 lang = 'en'
 
                 # ✅ 预设的主要按钮英文翻译
@@ -10655,11 +10658,18 @@ def jiexi(context: CallbackContext):
     # 获取充值地址
     trc20 = shangtext.find_one({'projectname': '充值地址'})['text']
 
-    # 获取所有未处理的区块记录
-    qukuai_list = qukuai.find({'state': 0, 'to_address': trc20})
+    # 获取所有未处理的区块记录（含认领超时的）
+    qukuai_list = qukuai.find({**qukuai_claimable_filter(), 'to_address': trc20})
 
     for i in qukuai_list:
+        # 原子认领：与 trc20_processor 互斥，已被对方认领的交易直接跳过
+        if not claim_qukuai_tx(i['_id']):
+            continue
         txid = i['txid']
+        # 幂等：该 txid 已有订单入账（如对方入账后未来得及标记完成），只补标记不再加余额
+        if topup.find_one({'txid': txid}, {'_id': 1}):
+            qukuai.update_one({'_id': i['_id']}, {"$set": {"state": QUKUAI_STATE_DONE}})
+            continue
         quant = i['quant']
         from_address = i['from_address']
         quant123 = Decimal(quant) / Decimal('1000000')
@@ -10729,16 +10739,9 @@ def jiexi(context: CallbackContext):
 充值: {today_money} USDT
 <a href="https://tronscan.org/#/transaction/{txid}">充值详细</a>
             '''
-            for admin in user.find({'state': '4'}):
-                try:
-                    context.bot.send_message(
-                        chat_id=admin['user_id'],
-                        text=admin_text,
-                        parse_mode='HTML',
-                        disable_web_page_preview=True
-                    )
-                except:
-                    continue
+            # 管理员并发发送（按 Bot 限速，429 自动等待重试）
+            admin_ids = [admin['user_id'] for admin in user.find({'state': '4'}, {'user_id': 1})]
+            safe_send_html_many(context.bot, admin_ids, admin_text, disable_web_page_preview=True)
 
             # Send agent group notification if this is an agent bot
             try:
@@ -10865,7 +10868,7 @@ def fbgg(update: Update, context: CallbackContext):
     context.bot.send_message(chat_id=user_id, text='🚀 正在开始群发广告...')
 
     def send_ads():
-        total_users = user.count_documents({})
+        total_users = user.estimated_document_count()
         success_count = 0
         fail_count = 0
         success_users = []
@@ -10878,7 +10881,20 @@ def fbgg(update: Update, context: CallbackContext):
         )
 
         all_users = list(user.find({}))
-        for idx, u in enumerate(all_users, start=1):
+        # 全部交给后台发送池（按用户保序、按 Bot 限速），再按顺序等待结果统计进度
+        futures = [
+            safe_send_html(
+                context.bot,
+                u['user_id'],
+                text,
+                batch=True,
+                reply_markup=InlineKeyboardMarkup([
+                    [InlineKeyboardButton("✅已读（点击销毁此消息）", callback_data=f"close {u['user_id']}")]
+                ])
+            )
+            for u in all_users
+        ]
+        for idx, (u, future) in enumerate(zip(all_users, futures), start=1):
             uid = u['user_id']
             first = u.get('first_name') or ''
             last = u.get('last_name') or ''
@@ -10886,18 +10902,11 @@ def fbgg(update: Update, context: CallbackContext):
             uname = '@' + u['username'] if u.get('username') else '无'
 
             user_info = f"{idx}. 昵称: {fullname} | 用户名: {uname} | ID: {uid}"
-            keyboard = [[InlineKeyboardButton("✅已读（点击销毁此消息）", callback_data=f'close {uid}')]]
 
-            try:
-                context.bot.send_message(
-                    chat_id=uid,
-                    text=text,
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode='HTML'
-                )
+            if future.result():
                 success_count += 1
                 success_users.append(user_info)
-            except:
+            else:
                 fail_count += 1
                 fail_users.append(user_info)
 
@@ -10920,8 +10929,6 @@ def fbgg(update: Update, context: CallbackContext):
                 except:
                     pass
 
-            time.sleep(0.5)  # 控制速率防封
-
         # 群发完成更新最终消息
         final_text = (
             f"✅ 广告发送完成！\n\n"
@@ -11534,6 +11541,14 @@ def start_bot_with_token(token, enable_agent_system=True, agent_context=None):
 def main():
     BOT_TOKEN = os.getenv('BOT_TOKEN')  # 从 .env 读取 token
 
+    # 启动时确保数据库索引存在（幂等操作）
+    try:
+        from db_indexes import ensure_indexes, ensure_qukuai_indexes
+        ensure_indexes(bot_db)
+        ensure_qukuai_indexes(qukuai)
+    except Exception as e:
+        logging.warning(f"⚠️ 创建数据库索引失败，继续启动: {e}")
+
     # Start Flask payment server only once for the master bot
     flask_thread = threading.Thread(target=start_flask_server, daemon=True)
     flask_thread.start()
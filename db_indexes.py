@@ -83,6 +83,12 @@ def ensure_indexes(db):
             name='idx_topup_bianhao'
         )
         
+        # USDT auto-crediting: pending orders matched by time window + amount
+        db.topup.create_index(
+            [('status', ASCENDING), ('cz_type', ASCENDING), ('time', ASCENDING), ('money', ASCENDING)],
+            name='idx_topup_status_type_time_money'
+        )
+        
         # hb (inventory) collection indexes
         db.hb.create_index(
             [('nowuid', ASCENDING), ('state', ASCENDING)],
@@ -94,6 +100,13 @@ def ensure_indexes(db):
             name='idx_hb_state'
         )
         
+        # Read back / roll back items claimed by one reserve_stock call
+        db.hb.create_index(
+            [('reservation_id', ASCENDING)],
+            sparse=True,
+            name='idx_hb_reservation'
+        )
+        
         # Agents collection indexes
         db.agents.create_index(
             [('agent_id', ASCENDING)],
@@ -106,6 +119,11 @@ def ensure_indexes(db):
             name='idx_agents_status'
         )
         
+        db.agents.create_index(
+            [('updated_at', DESCENDING)],
+            name='idx_agents_updated'
+        )
+        
         # Agent ledger collection indexes
         db.agent_ledger.create_index(
             [('agent_id', ASCENDING), ('status', ASCENDING)],
@@ -122,6 +140,18 @@ def ensure_indexes(db):
             name='idx_ledger_status_mature'
         )
         
+        # Maturity sweep: status + reverted equality, mature_at range
+        db.agent_ledger.create_index(
+            [('status', ASCENDING), ('reverted', ASCENDING), ('mature_at', ASCENDING)],
+            name='idx_ledger_status_reverted_mature'
+        )
+        
+        # Oldest-first scan of an agent's entries (mark_withdrawal_paid)
+        db.agent_ledger.create_index(
+            [('agent_id', ASCENDING), ('mature_at', ASCENDING)],
+            name='idx_ledger_agentid_mature'
+        )
+        
         db.agent_ledger.create_index(
             [('order_id', ASCENDING)],
             name='idx_ledger_orderid'
@@ -138,8 +168,49 @@ def ensure_indexes(db):
             name='idx_withdrawals_status_requested'
         )
         
+        # A credited TXID may credit only one topup order. Kept separate so
+        # legacy duplicate TXIDs don't stop the other indexes from building
+        try:
+            db.topup.create_index(
+                [('txid', ASCENDING)],
+                unique=True,
+                partialFilterExpression={'status': 'success'},
+                name='idx_topup_txid_success'
+            )
+        except Exception as e:
+            logging.warning(f"⚠️ Could not create unique txid index on topup: {e}")
+        
         logging.info("✅ All database indexes created successfully")
         
     except Exception as e:
         logging.error(f"❌ Error creating indexes: {e}")
         raise
+
+
+def ensure_qukuai_indexes(qukuai_collection):
+    """Ensure indexes on the qukuai (on-chain transfers) collection.
+    
+    qukuai lives in the main chain database rather than the bot database,
+    so it is handled separately from ensure_indexes.
+    
+    Args:
+        qukuai_collection: MongoDB collection of scanned transfers.
+    """
+    try:
+        # Rescan by order: USDT transfers in a time window for an amount
+        qukuai_collection.create_index(
+            [('type', ASCENDING), ('time', ASCENDING), ('quant', ASCENDING)],
+            name='idx_qukuai_type_time_quant'
+        )
+        
+        # Rescan / state updates by TXID
+        qukuai_collection.create_index(
+            [('txid', ASCENDING)],
+            name='idx_qukuai_txid'
+        )
+        
+        logging.info("✅ qukuai indexes created successfully")
+        
+    except Exception as e:
+        logging.error(f"❌ Error creating qukuai indexes: {e}")
+        raise
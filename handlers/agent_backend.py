@@ -1665,8 +1665,8 @@ def show_agent_stats_dashboard(
         # Recharges (topup collection)
         recharge_query = {
             'agent_id': agent_id,
-            'status': 'completed'
-        } if topup.find_one({'agent_id': {'$exists': True}}) else {'status': 'completed'}
+            'status': 'success'
+        } if topup.find_one({'agent_id': {'$exists': True}}) else {'status': 'success'}
         
         if time_filter and 'agent_id' in recharge_query:
             try:
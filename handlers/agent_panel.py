@@ -39,7 +39,7 @@ def agent_panel(update: Update, context: CallbackContext):
         
         # Get agent info
         agents_collection = bot_db['agents']
-        agent = get_agent_by_id(agents_collection, agent_id)
+        agent = get_agent_by_id(agents_collection, agent_id, cached=True)
         
         if not agent:
             text = "❌ Agent information not found"
@@ -247,7 +247,7 @@ def agent_withdraw_list_callback(update: Update, context: CallbackContext):
             return
         
         withdrawals_collection = bot_db['agent_withdrawals']
-        withdrawals = list_withdrawals(withdrawals_collection, agent_id=agent_id)
+        withdrawals = list_withdrawals(withdrawals_collection, agent_id=agent_id, limit=10)
         
         if not withdrawals:
             query.edit_message_text(
@@ -258,7 +258,7 @@ def agent_withdraw_list_callback(update: Update, context: CallbackContext):
         
         text = "<b>📋 My Withdrawals</b>\n\n"
         
-        for w in withdrawals[:10]:  # Last 10
+        for w in withdrawals:  # Last 10
             amount = w['amount']
             status = w['status']
             requested_at = w['requested_at'].strftime('%Y-%m-%d %H:%M')
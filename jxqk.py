@@ -91,11 +91,28 @@ def callback(ch, method, properties, body) -> None:
     try:
         ch.basic_ack(delivery_tag=method.delivery_tag)
         text = body.decode('utf-8')
-        block_list = json.loads(text)['block_list']
+        payload = json.loads(text)
+        # zf 追块时会把多个区块合并为一条 {"block_lists": [...]}
+        if 'block_lists' in payload:
+            block_lists = payload['block_lists']
+        else:
+            block_lists = [payload['block_list']]
+        address_list = search_address()
+        for block_list in block_lists:
+            process_block(block_list, address_list)
+
+    except (AMQPError, ChannelClosedByBroker) as e:
+        logging.error(f"❌ MQ 接收失败: {e}")
+    except Exception as e:
+        logging.exception(f"❌ 扫描区块时发生异常: {e}")
+
+
+def process_block(block_list, address_list) -> None:
+    try:
         transactions = block_list['transactions']
         number = block_list['block_header']['raw_data']['number']
-        address_list = search_address()
         logging.info(f"📦 收到区块数据：Block #{number}，交易数量：{len(transactions)}")
+        matched = []
 
         for trx in transactions:
             if trx["ret"][0]["contractRet"] == "SUCCESS":
@@ -128,19 +145,23 @@ def callback(ch, method, properties, body) -> None:
                             }
 
                             if message_data['to_address'] in address_list:
-                                qukuai.insert_one(message_data)
-                                logging.info(f"✅ 成功入库 USDT 交易: {message_data}")
-                                
-                                # Try to process and credit the order
-                                try:
-                                    from trc20_processor import payment_processor
-                                    payment_processor.process_transaction_from_qukuai(message_data)
-                                except Exception as e:
-                                    logging.error(f"Failed to process payment: {e}")
+                                matched.append(message_data)
+
+        # 整个区块的命中交易一次入库，再批量匹配订单（已处理标记一次 bulk_write 提交）
+        if matched:
+            qukuai.insert_many(matched)
+            for message_data in matched:
+                logging.info(f"✅ 成功入库 USDT 交易: {message_data}")
+            
+            # Try to process and credit the orders
+            try:
+                from trc20_processor import payment_processor
+                payment_processor.process_transactions_from_qukuai(matched)
+            except Exception as e:
+                logging.error(f"Failed to process payment: {e}")
 
-    except (AMQPError, ChannelClosedByBroker) as e:
-        logging.error(f"❌ MQ 接收失败: {e}")
     except Exception as e:
+        # 单个区块异常不影响同批其它区块
         logging.exception(f"❌ 扫描区块时发生异常: {e}")
 
 # ====== 启动监听 ======
@@ -433,6 +433,40 @@ def user_logging(uid, projectname , user_id, today_money, today_time):
         print(error_msg)
         logging.error(error_msg)
 
+# ✅ qukuai 交易状态：0 待处理，1 已入账，2 无匹配订单，3 已被某个入账流程认领
+QUKUAI_STATE_NEW = 0
+QUKUAI_STATE_DONE = 1
+QUKUAI_STATE_FAILED = 2
+QUKUAI_STATE_CLAIMED = 3
+# 认领后超过该时长仍未完成（进程崩溃等），允许重新认领
+QUKUAI_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+def qukuai_claimable_filter():
+    """待处理或认领已超时的 qukuai 交易"""
+    return {'$or': [
+        {'state': QUKUAI_STATE_NEW},
+        {'state': QUKUAI_STATE_CLAIMED, 'claimed_at': {'$lt': datetime.now() - QUKUAI_CLAIM_TIMEOUT}}
+    ]}
+
+def claim_qukuai_tx(tx_id) -> bool:
+    """原子认领一笔 qukuai 交易（按 _id），只有认领成功的一方可以入账。
+
+    bot.py 的 jiexi 与 trc20_processor 都通过这里认领，保证同一笔交易不会被两边同时入账；
+    认领超时后被重新认领的交易，由入账方按 txid 再查一次 topup 防止重复入账。
+    """
+    result = qukuai.update_one(
+        {'_id': tx_id, **qukuai_claimable_filter()},
+        {'$set': {'state': QUKUAI_STATE_CLAIMED, 'claimed_at': datetime.now()}}
+    )
+    return result.modified_count == 1
+
+def release_qukuai_tx(tx_id):
+    """入账未完成时释放认领，交还给后续流程处理"""
+    qukuai.update_one(
+        {'_id': tx_id, 'state': QUKUAI_STATE_CLAIMED},
+        {'$set': {'state': QUKUAI_STATE_NEW}, '$unset': {'claimed_at': ''}}
+    )
+
 def sydata(tranhash):
     """使用数据插入函数"""
     try:
@@ -3,13 +3,19 @@ from datetime import datetime
 import random, string
 import pymongo
 import telegram
+from telegram.utils.request import Request
 from apscheduler.schedulers.background import BackgroundScheduler
 import pytz
 import os
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from telegram.ext import CallbackContext
 from dotenv import load_dotenv
 
+from services.rate_limit import RateLimiter
+
 # 日志设置
 log_dir = "logs"
 os.makedirs(log_dir, exist_ok=True)
@@ -26,12 +32,18 @@ logging.info("Flask 回调服务已启动")
 # 加载环境变量
 load_dotenv()
 
+# 业务时区（模块加载时创建一次，通知消息与定时任务共用）
+_TZ = pytz.timezone('Asia/Shanghai')
+
 # ✅ 配置类集中管理
 class Config:
     # Bot 配置
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     ADMIN_IDS = list(map(int, filter(None, os.getenv("ADMIN_IDS", "").split(","))))
     
+    # 易支付配置
+    EASYPAY_KEY = os.getenv("EASYPAY_KEY")
+    
     # 数据库配置
     MONGO_URI = os.getenv("MONGO_URI", "mongodb://127.0.0.1:27017/")
     MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "xc1111bot")
@@ -44,6 +56,15 @@ class Config:
     ORDER_EXPIRE_MINUTES = int(os.getenv("ORDER_EXPIRE_MINUTES", 10))
     CLEANUP_INTERVAL_MINUTES = int(os.getenv("CLEANUP_INTERVAL_MINUTES", 3))
     
+    # Telegram HTTP 连接池配置
+    TG_CON_POOL_SIZE = int(os.getenv("TG_CON_POOL_SIZE", 32))
+    TG_CONNECT_TIMEOUT = float(os.getenv("TG_CONNECT_TIMEOUT", 5))
+    TG_READ_TIMEOUT = float(os.getenv("TG_READ_TIMEOUT", 10))
+    
+    # 通知并发配置（Telegram 限制约 30 条/秒）
+    NOTIFY_WORKERS = int(os.getenv("NOTIFY_WORKERS", 8))
+    NOTIFY_RATE_PER_SEC = int(os.getenv("NOTIFY_RATE_PER_SEC", 30))
+    
     # 金额匹配容差
     MONEY_TOLERANCE = float(os.getenv("MONEY_TOLERANCE", "0.01"))
     
@@ -52,6 +73,8 @@ class Config:
         """验证必要的配置"""
         if not cls.BOT_TOKEN:
             raise ValueError("❌ BOT_TOKEN 环境变量未设置")
+        if not cls.EASYPAY_KEY:
+            raise ValueError("❌ EASYPAY_KEY 环境变量未设置")
         if not cls.ADMIN_IDS:
             logging.warning("⚠️ ADMIN_IDS 未设置，无法发送管理员通知")
         logging.info("✅ 配置验证通过")
@@ -74,7 +97,13 @@ class DatabaseManager:
 
 class BotManager:
     def __init__(self):
-        self.bot = telegram.Bot(token=Config.BOT_TOKEN)
+        # 共享连接池，用户/管理员通知复用 TLS 连接（keep-alive）
+        self.request = Request(
+            con_pool_size=Config.TG_CON_POOL_SIZE,
+            connect_timeout=Config.TG_CONNECT_TIMEOUT,
+            read_timeout=Config.TG_READ_TIMEOUT
+        )
+        self.bot = telegram.Bot(token=Config.BOT_TOKEN, request=self.request)
         logging.info("✅ Telegram Bot 初始化完成")
     
     def send_message_safe(self, chat_id, text, **kwargs):
@@ -97,6 +126,10 @@ class BotManager:
 db_manager = DatabaseManager()
 bot_manager = BotManager()
 
+# 通知发送线程池与限速器（管理员通知并发发送）
+_notify_pool = ThreadPoolExecutor(max_workers=Config.NOTIFY_WORKERS, thread_name_prefix="notify")
+_notify_limiter = RateLimiter(Config.NOTIFY_RATE_PER_SEC)
+
 # ✅ 为了向后兼容，保留原有变量名
 client = db_manager.client
 db = db_manager.db
@@ -211,15 +244,19 @@ def generate_order_id():
 # ✅ 通知管理类
 class NotificationManager:
     @staticmethod
-    def create_payment_success_message(user_info, payment_info):
+    def create_payment_success_message(user_info, payment_info, title="充值成功通知"):
         """创建支付成功消息"""
+        return NotificationManager._payment_message_template(user_info).format_map({'title': title})
+    
+    @staticmethod
+    def _payment_message_template(user_info):
+        """渲染支付成功消息模板，标题保留为 {title} 占位符"""
         user_doc = user_info['user_doc']
         username = user_doc.get('username', '未知')
         fullname = user_doc.get('fullname', f'用户{user_info["user_id"]}')
-        now_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        now_time = user_info.get('now_str') or datetime.now(_TZ).strftime('%Y-%m-%d %H:%M:%S')
         
-        return (
-            "<b>充值成功通知</b>\n"
+        body = (
             "------------------------\n"
             f"<b>用户昵称：</b>{fullname} @{username}\n"
             f"<b>用户 ID：</b><code>{user_info['user_id']}</code>\n"
@@ -229,11 +266,26 @@ class NotificationManager:
             f"<b>订单编号：</b><code>{user_info['order']['bianhao']}</code>\n"
             f"<b>到账时间：</b>{now_time}\n"
         )
+        # 正文中可能含有花括号（如用户昵称），转义后仅保留标题占位符
+        return "<b>{title}</b>\n" + body.replace("{", "{{").replace("}", "}}")
     
     @staticmethod
-    def send_user_notification(user_info):
+    def send_all_notifications(user_info):
+        """发送用户及管理员通知，消息模板只渲染一次"""
+        user_info.setdefault('now_str', datetime.now(_TZ).strftime('%Y-%m-%d %H:%M:%S'))
+        template = NotificationManager._payment_message_template(user_info)
+        NotificationManager.send_user_notification(
+            user_info, template.format_map({'title': "充值成功通知"})
+        )
+        NotificationManager.send_admin_notifications(
+            user_info, template.format_map({'title': "用户充值到账通知"})
+        )
+    
+    @staticmethod
+    def send_user_notification(user_info, message=None):
         """发送用户通知"""
-        message = NotificationManager.create_payment_success_message(user_info, None)
+        if message is None:
+            message = NotificationManager.create_payment_success_message(user_info, None)
         
         return bot_manager.send_message_safe(
             chat_id=user_info['user_id'],
@@ -245,24 +297,33 @@ class NotificationManager:
         )
     
     @staticmethod
-    def send_admin_notifications(user_info):
+    def send_admin_notifications(user_info, admin_message=None):
         """发送管理员通知"""
-        message = NotificationManager.create_payment_success_message(user_info, None)
-        admin_message = message.replace("充值成功通知", "用户充值到账通知")
+        if admin_message is None:
+            admin_message = NotificationManager.create_payment_success_message(
+                user_info, None, title="用户充值到账通知"
+            )
         
-        success_count = 0
-        for admin_id in Config.ADMIN_IDS:
-            result = bot_manager.send_message_safe(
+        reply_markup = telegram.InlineKeyboardMarkup([
+            [telegram.InlineKeyboardButton("已读", callback_data=f"close {user_info['user_id']}")]
+        ])
+        
+        def _send(admin_id):
+            _notify_limiter.acquire()
+            return bot_manager.send_message_safe(
                 chat_id=admin_id,
                 text=admin_message,
                 parse_mode='HTML',
-                reply_markup=telegram.InlineKeyboardMarkup([
-                    [telegram.InlineKeyboardButton("已读", callback_data=f"close {user_info['user_id']}")]
-                ])
+                reply_markup=reply_markup
             )
-            if result:
+        
+        # 并发发送，墙钟时间由 O(N·RTT) 降为约一次 RTT
+        futures = {_notify_pool.submit(_send, admin_id): admin_id for admin_id in Config.ADMIN_IDS}
+        success_count = 0
+        for future in as_completed(futures):
+            if future.result():
                 success_count += 1
-                logging.info(f"✅ 管理员通知成功：{admin_id}")
+                logging.info(f"✅ 管理员通知成功：{futures[future]}")
         
         logging.info(f"📢 管理员通知完成：{success_count}/{len(Config.ADMIN_IDS)}")
     
@@ -283,9 +344,13 @@ def callback():
         data = request.values.to_dict()
         logging.info(f"📥 收到回调数据：{data}")
 
+        # 缺少订单号的请求直接拒绝，无需计算签名
+        if not (data.get("out_trade_no") or data.get("orderid")):
+            logging.warning("❌ 无效的回调数据：缺少订单号")
+            return "invalid data", 400
+
         # 🔐 第一步：验证签名（重要安全检查）
-        easypay_key = os.getenv("EASYPAY_KEY")
-        if not verify_easypay_sign(data, easypay_key):
+        if not verify_easypay_sign(data, Config.EASYPAY_KEY):
             logging.warning(f"❌ 签名验证失败：{data}")
             return "invalid signature", 403
 
@@ -322,8 +387,7 @@ def callback():
         NotificationManager.delete_payment_message(order)
 
         # 📢 第六步：发送通知
-        NotificationManager.send_user_notification(payment_info)
-        NotificationManager.send_admin_notifications(payment_info)
+        NotificationManager.send_all_notifications(payment_info)
 
         logging.info(f"🎉 支付回调处理完成：{orderid}")
         return "success"
@@ -341,25 +405,35 @@ class OrderCleanupManager:
             now = datetime.now()
             expired_query = {'status': 'pending', 'expire_time': {'$lt': now}}
             
-            # 统计超时订单数量
-            count = topup.count_documents(expired_query)
+            # 获取超时订单（不再单独 count_documents，直接以结果数量判断）
+            expired_orders = list(topup.find(expired_query).batch_size(200))
+            count = len(expired_orders)
             if count == 0:
                 return
             
             logging.info(f"🧹 发现 {count} 条超时订单，开始清理")
             
-            # 获取超时订单
-            expired_orders = topup.find(expired_query)
-            processed_count = 0
+            # 一次 update_many 批量标记超时（仍限定 pending）：查询之后刚支付成功的订单不会被改为超时
+            ids = [order['_id'] for order in expired_orders]
+            result = topup.update_many(
+                {'_id': {'$in': ids}, 'status': 'pending'},
+                {'$set': {'status': 'expired', 'expired_at': now}}
+            )
+            expired_count = result.modified_count
             
+            # 只通知本次真正改为超时的订单（按本次写入的 expired_at 回查）
+            expired_ids = {
+                doc['_id'] for doc in topup.find(
+                    {'_id': {'$in': ids}, 'status': 'expired', 'expired_at': now},
+                    {'_id': 1}
+                )
+            } if expired_count else set()
+            
+            processed_count = 0
             for order in expired_orders:
+                if order['_id'] not in expired_ids:
+                    continue
                 try:
-                    # 更新订单状态
-                    topup.update_one(
-                        {'_id': order['_id']}, 
-                        {'$set': {'status': 'expired', 'expired_at': now}}
-                    )
-                    
                     # 删除支付消息
                     NotificationManager.delete_payment_message(order)
                     
@@ -371,7 +445,7 @@ class OrderCleanupManager:
                 except Exception as e:
                     logging.error(f"❌ 处理超时订单失败 {order.get('bianhao', '未知')}: {e}")
             
-            logging.info(f"✅ 超时订单清理完成：{processed_count}/{count}")
+            logging.info(f"✅ 超时订单清理完成：已更新 {expired_count}/{count} 条，已通知 {processed_count} 条")
             
         except Exception as e:
             logging.error(f"❌ 订单清理失败：{e}")
@@ -420,7 +494,7 @@ class FlaskServerManager:
     def setup_scheduler(self):
         """设置定时任务"""
         try:
-            self.scheduler = BackgroundScheduler(timezone=pytz.timezone('Asia/Shanghai'))
+            self.scheduler = BackgroundScheduler(timezone=_TZ)
             self.scheduler.add_job(
                 clear_expired_orders, 
                 'interval', 
@@ -5,7 +5,8 @@ token encryption, pricing configuration, and status management.
 """
 
 import logging
-import time
+import threading
+from datetime import datetime
 from typing import Optional, List, Dict
 from services.crypto import encrypt_token, decrypt_token
 from models.constants import (
@@ -13,6 +14,40 @@ from models.constants import (
     MARKUP_TYPE_PERCENT, DEFAULT_MARKUP_PERCENT
 )
 
+try:
+    from cachetools import TTLCache
+except ImportError:
+    TTLCache = None
+
+# Short-lived cache for get_agent_by_id(..., cached=True), keyed by
+# (collection, agent_id). Many writers update agents directly and the cache
+# is per process, so it only backs display-only reads that tolerate being
+# up to AGENT_CACHE_TTL seconds stale. Disabled when cachetools is missing.
+AGENT_CACHE_TTL = 30
+_agent_cache = TTLCache(maxsize=1024, ttl=AGENT_CACHE_TTL) if TTLCache else None
+_agent_cache_lock = threading.RLock()
+
+# List queries skip the encrypted token; use get_agent_bot_token(s) for it
+_NO_TOKEN_PROJECTION = {'bot_token_encrypted': 0}
+
+
+def invalidate_agent_cache(agent_id: str = None) -> None:
+    """Drop cached agent documents.
+    
+    Call after writing to an agent document outside this module.
+    
+    Args:
+        agent_id: Agent to drop; clears the whole cache when None.
+    """
+    if _agent_cache is None:
+        return
+    with _agent_cache_lock:
+        if agent_id is None:
+            _agent_cache.clear()
+            return
+        for key in [k for k in _agent_cache if k[1] == agent_id]:
+            _agent_cache.pop(key, None)
+
 
 def create_agent(
     agents_collection,
@@ -46,6 +81,10 @@ def create_agent(
         # Encrypt the bot token
         encrypted_token = encrypt_token(bot_token)
         
+        # Stored as BSON dates so created_at/updated_at are range-queryable
+        # (agents has an index on updated_at, see db_indexes.py)
+        now = datetime.now()
+        
         agent_doc = {
             'agent_id': agent_id,
             'name': name,
@@ -63,13 +102,14 @@ def create_agent(
                 'welcome_text': None,  # Optional custom welcome text
                 'logo_url': None        # Optional custom logo
             },
-            'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'created_at': now,
             'created_by_admin_id': created_by_admin_id,
-            'updated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+            'updated_at': now
         }
         
         result = agents_collection.insert_one(agent_doc)
         agent_doc['_id'] = result.inserted_id
+        invalidate_agent_cache(agent_id)
         
         logging.info(f"Created agent: {agent_id} ({name})")
         return agent_doc
@@ -79,34 +119,58 @@ def create_agent(
         return None
 
 
-def get_agent_by_id(agents_collection, agent_id: str) -> Optional[Dict]:
+def get_agent_by_id(
+    agents_collection,
+    agent_id: str,
+    projection: Dict = None,
+    cached: bool = False
+) -> Optional[Dict]:
     """Get agent by ID.
     
     Args:
         agents_collection: MongoDB collection for agents.
         agent_id: Agent identifier.
+        projection: Optional MongoDB projection (bypasses the cache).
+        cached: Serve the full document from a AGENT_CACHE_TTL-second cache.
+            Only for display-only reads; anything feeding payouts,
+            withdrawals or settings edits must read MongoDB directly.
     
     Returns:
         Dict: Agent document, or None if not found.
+    
+    Callers must not mutate a cached document.
     """
     try:
-        return agents_collection.find_one({'agent_id': agent_id})
+        if not cached or _agent_cache is None or projection is not None:
+            return agents_collection.find_one({'agent_id': agent_id}, projection)
+        
+        key = (agents_collection.full_name, agent_id)
+        with _agent_cache_lock:
+            agent = _agent_cache.get(key)
+        if agent is None:
+            agent = agents_collection.find_one({'agent_id': agent_id})
+            if agent is not None:
+                with _agent_cache_lock:
+                    _agent_cache[key] = agent
+        return agent
     except Exception as e:
         logging.error(f"Error getting agent: {e}")
         return None
 
 
-def get_active_agents(agents_collection) -> List[Dict]:
+def get_active_agents(agents_collection, include_token: bool = False) -> List[Dict]:
     """Get all active agents.
     
     Args:
         agents_collection: MongoDB collection for agents.
+        include_token: Include the encrypted bot token field.
     
     Returns:
         List[Dict]: List of active agent documents.
     """
     try:
-        return list(agents_collection.find({'status': AGENT_STATUS_ACTIVE}))
+        projection = None if include_token else _NO_TOKEN_PROJECTION
+        return list(agents_collection.find({'status': AGENT_STATUS_ACTIVE}, projection))
     except Exception as e:
         logging.error(f"Error getting active agents: {e}")
         return []
@@ -133,12 +197,13 @@ def update_agent_status(
             {
                 '$set': {
                     'status': status,
-                    'updated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+                    'updated_at': datetime.now()
                 }
             }
         )
         
         if result.modified_count > 0:
+            invalidate_agent_cache(agent_id)
             logging.info(f"Updated agent {agent_id} status to {status}")
             return True
         return False
@@ -172,12 +237,13 @@ def update_agent_pricing(
                 '$set': {
                     'pricing.markup_type': markup_type,
                     'pricing.markup_value': markup_value,
-                    'updated_at': time.strftime('%Y-%m-%d %H:%M:%S')
+                    'updated_at': datetime.now()
                 }
             }
         )
         
         if result.modified_count > 0:
+            invalidate_agent_cache(agent_id)
             logging.info(
                 f"Updated agent {agent_id} pricing: "
                 f"{markup_type}={markup_value}"
@@ -218,19 +284,61 @@ def get_agent_bot_token(agents_collection, agent_id: str) -> Optional[str]:
         return None
 
 
-def list_agents(agents_collection, status: str = None) -> List[Dict]:
+def get_agent_bot_tokens(agents_collection, agent_ids: List[str]) -> Dict[str, str]:
+    """Get decrypted bot tokens for several agents in one query.
+    
+    Args:
+        agents_collection: MongoDB collection for agents.
+        agent_ids: Agent identifiers.
+    
+    Returns:
+        Dict[str, str]: Mapping of agent_id to decrypted bot token. Agents
+        that are missing or whose token cannot be decrypted are omitted.
+    """
+    tokens = {}
+    if not agent_ids:
+        return tokens
+    
+    try:
+        cursor = agents_collection.find(
+            {'agent_id': {'$in': list(agent_ids)}},
+            {'agent_id': 1, 'bot_token_encrypted': 1}
+        )
+        for agent in cursor:
+            agent_id = agent['agent_id']
+            encrypted_token = agent.get('bot_token_encrypted')
+            if not encrypted_token:
+                logging.error(f"No encrypted token for agent: {agent_id}")
+                continue
+            try:
+                tokens[agent_id] = decrypt_token(encrypted_token)
+            except ValueError as e:
+                logging.error(f"Error decrypting bot token for agent {agent_id}: {e}")
+    except Exception as e:
+        logging.error(f"Error getting agent bot tokens: {e}")
+    
+    return tokens
+
+
+def list_agents(
+    agents_collection,
+    status: str = None,
+    include_token: bool = False
+) -> List[Dict]:
     """List all agents, optionally filtered by status.
     
     Args:
         agents_collection: MongoDB collection for agents.
         status: Optional status filter.
+        include_token: Include the encrypted bot token field.
     
     Returns:
         List[Dict]: List of agent documents.
     """
     try:
         query = {} if status is None else {'status': status}
-        return list(agents_collection.find(query))
+        projection = None if include_token else _NO_TOKEN_PROJECTION
+        return list(agents_collection.find(query, projection))
     except Exception as e:
         logging.error(f"Error listing agents: {e}")
         return []
@@ -2,18 +2,28 @@
 
 This module provides AES-GCM encryption for agent bot tokens.
 The encryption key is read from the AGENT_TOKEN_AES_KEY environment variable (base64 encoded).
+Encrypted tokens are stored as BSON Binary; base64 strings written by older
+versions are still accepted by decrypt_token.
 """
 
 import os
 import base64
 import logging
+import threading
+from functools import lru_cache
+from typing import Optional, Union
+from bson.binary import Binary
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.exceptions import InvalidTag
 
 
+@lru_cache(maxsize=1)
 def get_encryption_key() -> bytes:
     """Get the encryption key from environment variable.
     
+    The variable is read and validated once per process; call
+    ``reset_encryption_key()`` to pick up a changed key.
+    
     Returns:
         bytes: The decoded encryption key (16, 24, or 32 bytes for AES).
     
@@ -41,14 +51,46 @@ def get_encryption_key() -> bytes:
     return key
 
 
-def encrypt_token(plaintext: str) -> str:
+# Cipher is built once from the environment key and reused by all calls.
+_AESGCM_SINGLETON: Optional[AESGCM] = None
+_AESGCM_LOCK = threading.Lock()
+
+
+def _get_cipher() -> AESGCM:
+    """Get the shared AESGCM cipher, creating it on first use.
+    
+    Returns:
+        AESGCM: Cipher initialized with the key from get_encryption_key().
+    
+    Raises:
+        ValueError: If key is not set or has invalid length.
+    """
+    global _AESGCM_SINGLETON
+    cipher = _AESGCM_SINGLETON
+    if cipher is None:
+        with _AESGCM_LOCK:
+            if _AESGCM_SINGLETON is None:
+                _AESGCM_SINGLETON = AESGCM(get_encryption_key())
+            cipher = _AESGCM_SINGLETON
+    return cipher
+
+
+def reset_encryption_key() -> None:
+    """Forget the cached key and cipher so the next call re-reads the environment."""
+    global _AESGCM_SINGLETON
+    with _AESGCM_LOCK:
+        get_encryption_key.cache_clear()
+        _AESGCM_SINGLETON = None
+
+
+def encrypt_token(plaintext: str) -> Binary:
     """Encrypt a plaintext token using AES-GCM.
     
     Args:
         plaintext: The plaintext token to encrypt.
     
     Returns:
-        str: Base64-encoded encrypted data (nonce + ciphertext + tag).
+        Binary: Encrypted data (nonce + ciphertext + tag).
     
     Raises:
         ValueError: If encryption key is invalid.
@@ -56,27 +98,30 @@ def encrypt_token(plaintext: str) -> str:
     if not plaintext:
         raise ValueError("Plaintext token cannot be empty")
     
-    key = get_encryption_key()
-    aesgcm = AESGCM(key)
+    aesgcm = _get_cipher()
     
     # Generate a random 12-byte nonce
     nonce = os.urandom(12)
     
-    # Encrypt the plaintext
-    ciphertext = aesgcm.encrypt(nonce, plaintext.encode('utf-8'), None)
+    # Telegram bot tokens are ASCII; use the faster codec when possible
+    try:
+        data = plaintext.encode('ascii')
+    except UnicodeEncodeError:
+        data = plaintext.encode('utf-8')
     
-    # Combine nonce + ciphertext for storage
-    encrypted_data = nonce + ciphertext
+    # Encrypt the plaintext
+    ciphertext = aesgcm.encrypt(nonce, data, None)
     
-    # Return as base64 for easy storage
-    return base64.b64encode(encrypted_data).decode('utf-8')
+    # Combine nonce + ciphertext and store as raw BSON binary
+    return Binary(nonce + ciphertext)
 
 
-def decrypt_token(encrypted_b64: str) -> str:
+def decrypt_token(encrypted_b64: Union[bytes, str]) -> str:
     """Decrypt an encrypted token using AES-GCM.
     
     Args:
-        encrypted_b64: Base64-encoded encrypted data (nonce + ciphertext + tag).
+        encrypted_b64: Encrypted data (nonce + ciphertext + tag), either raw
+            bytes/Binary or a legacy base64-encoded string.
     
     Returns:
         str: The decrypted plaintext token.
@@ -88,11 +133,13 @@ def decrypt_token(encrypted_b64: str) -> str:
         raise ValueError("Encrypted token cannot be empty")
     
     try:
-        key = get_encryption_key()
-        aesgcm = AESGCM(key)
+        aesgcm = _get_cipher()
         
-        # Decode from base64
-        encrypted_data = base64.b64decode(encrypted_b64)
+        # Raw bytes are used as-is; legacy values are base64 strings
+        if isinstance(encrypted_b64, (bytes, bytearray)):
+            encrypted_data = bytes(encrypted_b64)
+        else:
+            encrypted_data = base64.b64decode(encrypted_b64)
         
         # Extract nonce (first 12 bytes) and ciphertext
         nonce = encrypted_data[:12]
@@ -100,7 +147,10 @@ def decrypt_token(encrypted_b64: str) -> str:
         
         # Decrypt
         plaintext_bytes = aesgcm.decrypt(nonce, ciphertext, None)
-        return plaintext_bytes.decode('utf-8')
+        try:
+            return plaintext_bytes.decode('ascii')
+        except UnicodeDecodeError:
+            return plaintext_bytes.decode('utf-8')
         
     except InvalidTag:
         logging.error("Decryption failed: Invalid authentication tag")
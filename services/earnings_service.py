@@ -1,13 +1,17 @@
 """Earnings service for agent profit tracking and withdrawals.
 
 This module manages the agent ledger, profit maturity, and withdrawal lifecycle.
+Timestamps are naive local datetimes; each function reads the clock once and
+reuses that value for every field it writes.
+Ledger amounts are computed and stored as integer cents (``*_cents`` fields);
+the float fields are kept alongside for display and older readers.
 """
 
 import logging
 import time
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
-from decimal import Decimal
+from pymongo import UpdateOne
 from models.constants import (
     LEDGER_STATUS_PENDING, LEDGER_STATUS_MATURED, LEDGER_STATUS_WITHDRAWN,
     LEDGER_STATUS_REVERTED, LEDGER_TYPE_SALE, LEDGER_TYPE_REFUND,
@@ -17,6 +21,25 @@ from models.constants import (
 )
 
 
+# Ledger status -> key in the get_agent_balance result
+_STATUS_TO_BALANCE_KEY = {
+    LEDGER_STATUS_PENDING: 'pending',
+    LEDGER_STATUS_MATURED: 'available',
+    LEDGER_STATUS_WITHDRAWN: 'withdrawn',
+}
+
+
+def to_cents(amount) -> int:
+    """Convert a money amount to integer cents, rounded to the nearest cent."""
+    return int(round(float(amount) * 100))
+
+
+def _entry_cents(entry: Dict) -> int:
+    """Get a ledger entry's profit in cents (older entries only have 'profit')."""
+    cents = entry.get('profit_cents')
+    return cents if cents is not None else to_cents(entry['profit'])
+
+
 def add_profit_on_order(
     ledger_collection,
     agent_id: str,
@@ -39,10 +62,12 @@ def add_profit_on_order(
         Dict: Ledger entry document, or None on error.
     """
     try:
-        # Calculate profit per item and total profit
-        profit_per_item = Decimal(str(agent_price)) - Decimal(str(base_price))
-        total_profit = profit_per_item * Decimal(str(qty))
-        total_profit = float(total_profit.quantize(Decimal('0.01')))
+        # Calculate profit per item and total profit in integer cents
+        base_price_cents = to_cents(base_price)
+        agent_price_cents = to_cents(agent_price)
+        markup_cents = agent_price_cents - base_price_cents
+        profit_cents = markup_cents * int(qty)
+        total_profit = profit_cents / 100
         
         # Calculate maturity time
         now = datetime.now()
@@ -56,9 +81,13 @@ def add_profit_on_order(
             'status': LEDGER_STATUS_PENDING,
             'base_price': base_price,
             'agent_price': agent_price,
-            'markup_per_item': float(profit_per_item.quantize(Decimal('0.01'))),
+            'markup_per_item': markup_cents / 100,
             'qty': qty,
             'profit': total_profit,
+            'base_price_cents': base_price_cents,
+            'agent_price_cents': agent_price_cents,
+            'markup_cents': markup_cents,
+            'profit_cents': profit_cents,
             'created_at': now,
             'mature_at': mature_at,
             'matured_at': None,
@@ -109,6 +138,8 @@ def add_refund_entry(
             logging.warning(f"Ledger entry already reverted: {original_ledger_id}")
             return False
         
+        now = datetime.now()
+        
         # Mark original as reverted
         ledger_collection.update_one(
             {'_id': original_ledger_id},
@@ -116,7 +147,7 @@ def add_refund_entry(
                 '$set': {
                     'reverted': True,
                     'revert_reason': refund_reason,
-                    'reverted_at': datetime.now()
+                    'reverted_at': now
                 }
             }
         )
@@ -133,7 +164,8 @@ def add_refund_entry(
             'markup_per_item': original.get('markup_per_item'),
             'qty': original.get('qty'),
             'profit': -original.get('profit'),  # Negative profit
-            'created_at': datetime.now(),
+            'profit_cents': -_entry_cents(original),
+            'created_at': now,
             'mature_at': None,
             'matured_at': None,
             'withdrawn_at': None,
@@ -205,41 +237,27 @@ def get_agent_balance(ledger_collection, agent_id: str) -> Dict[str, float]:
         Dict with 'pending', 'available', and 'withdrawn' balances.
     """
     try:
+        # Older entries have no profit_cents; derive it from profit
+        cents = {'$ifNull': ['$profit_cents', {'$multiply': ['$profit', 100]}]}
+        
+        group = {'_id': None}
+        for status, key in _STATUS_TO_BALANCE_KEY.items():
+            group[key] = {'$sum': {'$cond': [{'$eq': ['$status', status]}, cents, 0]}}
+        
         pipeline = [
             {'$match': {'agent_id': agent_id}},
-            {
-                '$group': {
-                    '_id': '$status',
-                    'total': {'$sum': '$profit'}
-                }
-            }
+            {'$group': group},
+            {'$project': {'_id': 0}}
         ]
         
-        results = list(ledger_collection.aggregate(pipeline))
+        result = next(ledger_collection.aggregate(pipeline), None) or {}
         
-        balances = {
-            'pending': 0.0,
-            'available': 0.0,
-            'withdrawn': 0.0,
-            'total_earned': 0.0
+        totals = {
+            key: round(result.get(key, 0))
+            for key in _STATUS_TO_BALANCE_KEY.values()
         }
-        
-        for r in results:
-            status = r['_id']
-            amount = float(r['total'])
-            
-            if status == LEDGER_STATUS_PENDING:
-                balances['pending'] = amount
-            elif status == LEDGER_STATUS_MATURED:
-                balances['available'] = amount
-            elif status == LEDGER_STATUS_WITHDRAWN:
-                balances['withdrawn'] = amount
-        
-        balances['total_earned'] = (
-            balances['pending'] + 
-            balances['available'] + 
-            balances['withdrawn']
-        )
+        balances = {key: cents_total / 100 for key, cents_total in totals.items()}
+        balances['total_earned'] = sum(totals.values()) / 100
         
         return balances
         
@@ -388,25 +406,30 @@ def mark_withdrawal_paid(
         # Mark matured ledger entries as withdrawn up to the amount
         now = datetime.now()
         
-        # Get matured entries oldest first
-        matured_entries = list(ledger_collection.find({
-            'agent_id': agent_id,
-            'status': LEDGER_STATUS_MATURED,
-            'reverted': False
-        }).sort('mature_at', 1))
+        # Stream matured entries oldest first; only the fields needed to
+        # settle the amount are fetched and iteration stops once covered
+        matured_entries = ledger_collection.find(
+            {
+                'agent_id': agent_id,
+                'status': LEDGER_STATUS_MATURED,
+                'reverted': False
+            },
+            {'_id': 1, 'profit': 1, 'profit_cents': 1}
+        ).sort('mature_at', 1).batch_size(64)
         
-        remaining = Decimal(str(amount))
+        remaining = to_cents(amount)
         updated_count = 0
+        ops = []
         
         for entry in matured_entries:
             if remaining <= 0:
                 break
             
-            profit = Decimal(str(entry['profit']))
+            profit = _entry_cents(entry)
             
             if profit <= remaining:
                 # Mark entire entry as withdrawn
-                ledger_collection.update_one(
+                ops.append(UpdateOne(
                     {'_id': entry['_id']},
                     {
                         '$set': {
@@ -415,7 +438,7 @@ def mark_withdrawal_paid(
                             'withdrawal_id': withdrawal_id
                         }
                     }
-                )
+                ))
                 remaining -= profit
                 updated_count += 1
             else:
@@ -425,6 +448,11 @@ def mark_withdrawal_paid(
                     f"skipping entry {entry['_id']}"
                 )
                 break
+        matured_entries.close()
+        
+        # Apply all ledger updates in a single round trip
+        if ops:
+            ledger_collection.bulk_write(ops, ordered=False)
         
         # Update withdrawal status
         withdrawals_collection.update_one(
@@ -493,14 +521,18 @@ def reject_withdrawal(
 def list_withdrawals(
     withdrawals_collection,
     agent_id: str = None,
-    status: str = None
+    status: str = None,
+    limit: int = 50,
+    skip: int = 0
 ) -> List[Dict]:
-    """List withdrawal requests.
+    """List withdrawal requests, newest first.
     
     Args:
         withdrawals_collection: MongoDB collection for withdrawals.
         agent_id: Optional filter by agent ID.
         status: Optional filter by status.
+        limit: Maximum number of documents to return (0 for all).
+        skip: Number of documents to skip, for paging.
     
     Returns:
         List[Dict]: List of withdrawal documents.
@@ -512,7 +544,12 @@ def list_withdrawals(
         if status:
             query['status'] = status
         
-        return list(withdrawals_collection.find(query).sort('requested_at', -1))
+        cursor = withdrawals_collection.find(query).sort('requested_at', -1)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
         
     except Exception as e:
         logging.error(f"Error listing withdrawals: {e}")
@@ -4,9 +4,27 @@ This module provides consistent language detection and translation across all vi
 """
 
 import logging
+import string
+import sys
+import threading
 from telegram import Update
 from telegram.ext import CallbackContext
 
+try:
+    from mongo import user as _user_collection
+except Exception:  # mongo unavailable or misconfigured; skip DB lookups
+    _user_collection = None
+
+try:
+    from cachetools import TTLCache
+except ImportError:
+    TTLCache = None
+
+# Per-user language cache so bursts of callbacks from one user don't each
+# query MongoDB. Disabled when cachetools is not installed.
+_lang_cache = TTLCache(maxsize=100_000, ttl=60) if TTLCache else None
+_lang_cache_lock = threading.Lock()
+
 
 def get_locale(update: Update = None, context: CallbackContext = None, user_doc: dict = None) -> str:
     """Get user's preferred language (zh or en).
@@ -32,14 +50,21 @@ def get_locale(update: Update = None, context: CallbackContext = None, user_doc:
             return lang
     
     # Try to get from database if we have user_id
-    if update and update.effective_user:
+    if update and update.effective_user and _user_collection is not None:
+        user_id = update.effective_user.id
+        if _lang_cache is not None:
+            with _lang_cache_lock:
+                lang = _lang_cache.get(user_id)
+            if lang is not None:
+                return lang
         try:
-            from mongo import user
-            user_id = update.effective_user.id
-            user_data = user.find_one({'user_id': user_id})
+            user_data = _user_collection.find_one({'user_id': user_id})
             if user_data and user_data.get('lang'):
                 lang = user_data['lang']
                 if lang in ['zh', 'en']:
+                    if _lang_cache is not None:
+                        with _lang_cache_lock:
+                            _lang_cache[user_id] = lang
                     return lang
         except Exception as e:
             logging.debug(f"Could not fetch user language from DB: {e}")
@@ -70,19 +95,108 @@ def set_user_locale(user_id: int, lang: str) -> bool:
         logging.warning(f"Invalid language code: {lang}")
         return False
     
+    if _user_collection is None:
+        logging.error("Failed to set user locale: user collection unavailable")
+        return False
+    
     try:
-        from mongo import user
-        user.update_one(
+        _user_collection.update_one(
             {'user_id': user_id},
             {'$set': {'lang': lang}},
             upsert=False
         )
+        if _lang_cache is not None:
+            with _lang_cache_lock:
+                _lang_cache[user_id] = lang
         return True
     except Exception as e:
         logging.error(f"Failed to set user locale: {e}")
         return False
 
 
+# Flattened translation tables, keyed by id() of the source i18n dict. The
+# source dict is kept alongside so its id cannot be reused while cached.
+_compiled_i18n = {}
+_compiled_i18n_lock = threading.Lock()
+
+# Marker for templates whose fields are too complex for _format_parsed
+# (positional, attribute/index access, nested specs); they use str.format.
+_USE_STR_FORMAT = object()
+_CONVERTERS = {'r': repr, 's': str, 'a': ascii}
+
+
+def _parse_template(text: str):
+    """Pre-parse a format template once.
+    
+    Returns:
+        None if the text has no fields, _USE_STR_FORMAT if it needs the full
+        str.format machinery, otherwise a tuple of
+        (literal, field_name, format_spec, conversion) parts.
+    """
+    if '{' not in text and '}' not in text:
+        return None
+    try:
+        parts = tuple(string.Formatter().parse(text))
+    except ValueError:
+        return _USE_STR_FORMAT
+    for _, name, spec, _ in parts:
+        if name is not None and (not name.isidentifier() or '{' in spec):
+            return _USE_STR_FORMAT
+    return parts
+
+
+def _format_parsed(parts, kwargs: dict) -> str:
+    """Render pre-parsed template parts; raises KeyError like str.format."""
+    out = []
+    for literal, name, spec, conversion in parts:
+        out.append(literal)
+        if name is not None:
+            value = kwargs[name]
+            if conversion:
+                value = _CONVERTERS[conversion](value)
+            out.append(format(value, spec))
+    return ''.join(out)
+
+
+def compile_i18n(i18n_dict: dict) -> dict:
+    """Flatten an i18n dictionary into a {(lang, key): text} lookup table.
+    
+    Missing translations are filled in at compile time from zh, then en,
+    then the key itself, so rendering needs a single dict lookup. Each
+    template is also pre-parsed for formatting. The result is cached per
+    dictionary; i18n dictionaries are treated as constants and later
+    changes to them are not picked up.
+    
+    Args:
+        i18n_dict: Dictionary containing translations {'zh': {...}, 'en': {...}}
+    
+    Returns:
+        dict: Flat {(lang, key): (text, parsed_parts)} table with interned keys
+    """
+    cached = _compiled_i18n.get(id(i18n_dict))
+    if cached is not None and cached[0] is i18n_dict:
+        return cached[1]
+    
+    zh = i18n_dict.get('zh', {})
+    en = i18n_dict.get('en', {})
+    all_keys = set()
+    for texts in i18n_dict.values():
+        all_keys.update(texts)
+    
+    compiled = {}
+    for lang, texts in i18n_dict.items():
+        lang = sys.intern(lang)
+        for key in all_keys:
+            text = texts.get(key)
+            if text is None:
+                text = zh.get(key) or en.get(key) or key
+            compiled[(lang, sys.intern(key))] = (text, _parse_template(text))
+    
+    with _compiled_i18n_lock:
+        _compiled_i18n[id(i18n_dict)] = (i18n_dict, compiled)
+    return compiled
+
+
 def render_text(lang: str, key: str, i18n_dict: dict, **kwargs) -> str:
     """Render a translated text with fallback support.
     
@@ -95,20 +209,24 @@ def render_text(lang: str, key: str, i18n_dict: dict, **kwargs) -> str:
     Returns:
         str: Translated and formatted string
     """
-    # Ensure valid language
-    if lang not in i18n_dict:
-        lang = 'zh' if 'zh' in i18n_dict else list(i18n_dict.keys())[0]
+    compiled = compile_i18n(i18n_dict)
+    entry = compiled.get((lang, key))
+    
+    if entry is None:
+        # Unknown language falls back to zh (or the first language);
+        # unknown keys render as the key itself
+        if lang not in i18n_dict:
+            lang = 'zh' if 'zh' in i18n_dict else next(iter(i18n_dict))
+        entry = compiled.get((lang, key)) or (key, _parse_template(key))
     
-    # Get translation with fallback
-    translation = i18n_dict[lang].get(key)
-    if translation is None:
-        # Fallback to zh, then en, then the key itself
-        translation = i18n_dict.get('zh', {}).get(key) or i18n_dict.get('en', {}).get(key) or key
+    translation, parts = entry
     
     # Format with parameters if provided
-    if kwargs:
+    if kwargs and parts is not None:
         try:
-            return translation.format(**kwargs)
+            if parts is _USE_STR_FORMAT:
+                return translation.format(**kwargs)
+            return _format_parsed(parts, kwargs)
         except Exception as e:
             logging.error(f"Translation format error for key '{key}': {e}")
             return translation
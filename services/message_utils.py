@@ -1,18 +1,111 @@
 """Message utilities for safe HTML sending and editing."""
 
 import logging
-import html
 import hashlib
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Union
 from telegram import Bot, ParseMode, InlineKeyboardMarkup
-from telegram.error import BadRequest, TelegramError
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from services.rate_limit import RateLimiter
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# Set VIEW_HASH_CRYPTO=1 to key views with a cryptographic hash (blake3, or
+# stdlib blake2b) instead of xxh3, e.g. to rule out crafted-keyboard collisions
+VIEW_HASH_CRYPTO = os.getenv('VIEW_HASH_CRYPTO', '').lower() in ('1', 'true', 'yes')
+
+
+# Resolved once at import rather than as ParseMode.HTML on every send
+_HTML = ParseMode.HTML
+
+# Same output as html.escape(text, quote=True), applied as a single C-level pass
+_HTML_ESCAPE_TABLE = str.maketrans({
+    '&': '&amp;',
+    '<': '&lt;',
+    '>': '&gt;',
+    '"': '&quot;',
+    "'": '&#x27;',
+})
+
+
+# View hasher factory and digest->int conversion, picked once at import
+if not VIEW_HASH_CRYPTO and xxhash is not None:
+    _new_view_hasher = xxhash.xxh3_64
+    
+    def _hasher_int(hasher) -> int:
+        """Get a hasher's digest as an int."""
+        return hasher.intdigest()
+elif VIEW_HASH_CRYPTO and blake3 is not None:
+    _new_view_hasher = blake3.blake3
+    
+    def _hasher_int(hasher) -> int:
+        """Get a hasher's digest as an int (truncated to 64 bits)."""
+        return int.from_bytes(hasher.digest(length=8), 'big')
+else:
+    def _new_view_hasher():
+        """Create a 64-bit blake2b hasher for view de-duplication."""
+        return hashlib.blake2b(digest_size=8)
+    
+    def _hasher_int(hasher) -> int:
+        """Get a hasher's digest as an int."""
+        return int.from_bytes(hasher.digest(), 'big')
+
+
+# Telegram allows about 30 messages per second per bot; a 429 (RetryAfter)
+# is waited out and retried up to SEND_MAX_RETRIES times
+BROADCAST_RATE_PER_SEC = 30
+SEND_MAX_RETRIES = 3
+
+
+_send_limiters = {}
+_send_limiters_lock = threading.Lock()
+
+
+def _send_limiter(bot: Bot) -> RateLimiter:
+    """Per-bot rate limiter for bulk/background sends (the limit is per token)."""
+    key = getattr(bot, 'token', None) or id(bot)
+    with _send_limiters_lock:
+        limiter = _send_limiters.get(key)
+        if limiter is None:
+            limiter = _send_limiters[key] = RateLimiter(BROADCAST_RATE_PER_SEC)
+    return limiter
+
+
+def _send_message(bot: Bot, chat_id: int, **params):
+    """bot.send_message, waiting out RetryAfter instead of dropping the message."""
+    for attempt in range(1, SEND_MAX_RETRIES + 1):
+        try:
+            return bot.send_message(chat_id=chat_id, **params)
+        except RetryAfter as e:
+            if attempt == SEND_MAX_RETRIES:
+                raise
+            logging.warning(f"Rate limited sending to {chat_id}, retrying in {e.retry_after}s")
+            time.sleep(e.retry_after)
 
 
 def safe_send_html(
     bot: Bot,
     chat_id: int,
     text: str,
+    batch: bool = False,
+    *,
+    coalesce: bool = False,
     **kwargs
-) -> bool:
+) -> Union[bool, Future]:
     """Send a message with HTML parsing, falling back to escaped text on failure.
     
     This prevents batch notification failures due to malformed HTML in
@@ -22,17 +115,27 @@ def safe_send_html(
         bot: Telegram Bot instance.
         chat_id: Chat ID to send to.
         text: Message text (may contain HTML).
+        batch: Queue the message for the background sender pool instead of
+            blocking; a Future resolving to the send result is returned.
+        coalesce: With batch=True, join this message with other coalesce=True
+            plain messages (no extra kwargs) queued for the same chat within
+            BATCH_FLUSH_DELAY into one send_message call.
         **kwargs: Additional arguments to pass to send_message.
     
     Returns:
-        bool: True if sent successfully.
+        bool: True if sent successfully. With batch=True, a Future that
+        resolves to that bool once the message has actually been sent.
     """
+    if batch:
+        return _batch_sender.enqueue(bot, chat_id, text, kwargs, coalesce)
+    
     try:
         # First try with HTML parse mode
-        bot.send_message(
-            chat_id=chat_id,
+        _send_message(
+            bot,
+            chat_id,
             text=text,
-            parse_mode=ParseMode.HTML,
+            parse_mode=_HTML,
             **kwargs
         )
         return True
@@ -45,9 +148,10 @@ def safe_send_html(
         )
         
         try:
-            escaped_text = html.escape(text)
-            bot.send_message(
-                chat_id=chat_id,
+            escaped_text = text.translate(_HTML_ESCAPE_TABLE)
+            _send_message(
+                bot,
+                chat_id,
                 text=escaped_text,
                 parse_mode=None,
                 **kwargs
@@ -63,32 +167,226 @@ def safe_send_html(
         return False
 
 
-def compute_view_key(text: str, keyboard: InlineKeyboardMarkup = None) -> str:
+# Worker threads per broadcast; the send rate itself is capped by the
+# per-bot BROADCAST_RATE_PER_SEC limiter
+BROADCAST_CONCURRENCY = 8
+
+
+def safe_send_html_many(
+    bot: Bot,
+    chat_ids,
+    text: str,
+    max_concurrency: int = BROADCAST_CONCURRENCY,
+    **kwargs
+) -> int:
+    """Send the same message to many chats concurrently via safe_send_html.
+    
+    Up to max_concurrency requests are in flight at once instead of one per
+    round trip, while the bot's rate limiter keeps the overall rate within
+    BROADCAST_RATE_PER_SEC; RetryAfter responses are waited out and retried.
+    The bot's Request should have a connection pool at least max_concurrency
+    large (con_pool_size) so the sends reuse keep-alive connections.
+    
+    Args:
+        bot: Telegram Bot instance.
+        chat_ids: Iterable of chat IDs to send to.
+        text: Message text (may contain HTML).
+        max_concurrency: Maximum number of concurrent sends.
+        **kwargs: Additional arguments to pass to send_message.
+    
+    Returns:
+        int: Number of chats the message was sent to.
+    """
+    chat_ids = list(chat_ids)
+    if not chat_ids:
+        return 0
+    
+    limiter = _send_limiter(bot)
+    
+    def _send(chat_id):
+        limiter.acquire()
+        return safe_send_html(bot, chat_id, text, **kwargs)
+    
+    workers = max(1, min(max_concurrency, len(chat_ids)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="safe-send-many") as pool:
+        return sum(pool.map(_send, chat_ids))
+
+
+# Background sending for safe_send_html(batch=True)
+BATCH_WORKERS = 8
+BATCH_FLUSH_DELAY = 0.1
+BATCH_MAX_CHARS = 4000
+
+
+class _BatchSender:
+    """Sends queued messages from a bounded pool of background threads.
+    
+    Each chat is pinned to one of BATCH_WORKERS workers, so different chats
+    are sent concurrently while messages to the same chat keep their queue
+    order. coalesce=True messages are held per chat for BATCH_FLUSH_DELAY
+    and joined (up to BATCH_MAX_CHARS per send); everything else is sent as
+    is. Every queued message gets a Future with its result.
+    """
+    
+    def __init__(self, workers: int = BATCH_WORKERS):
+        self._queues = [queue.Queue() for _ in range(max(1, workers))]
+        self._lock = threading.Lock()
+        self._started = False
+    
+    def enqueue(self, bot: Bot, chat_id: int, text: str, kwargs: dict, coalesce: bool) -> Future:
+        self._ensure_threads()
+        future = Future()
+        worker_queue = self._queues[hash(chat_id) % len(self._queues)]
+        worker_queue.put((bot, chat_id, text, kwargs, coalesce and not kwargs, future))
+        return future
+    
+    def _ensure_threads(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            for index, worker_queue in enumerate(self._queues):
+                threading.Thread(
+                    target=self._run, args=(worker_queue,), daemon=True,
+                    name=f"safe-send-batch-{index}"
+                ).start()
+            self._started = True
+    
+    def _run(self, worker_queue: queue.Queue):
+        # (id(bot), chat_id) -> [deadline, bot, texts, futures]
+        pending = {}
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0, min(entry[0] for entry in pending.values()) - time.monotonic())
+            try:
+                bot, chat_id, text, kwargs, coalesce, future = worker_queue.get(timeout=timeout)
+            except queue.Empty:
+                pass
+            else:
+                if coalesce:
+                    entry = pending.get((id(bot), chat_id))
+                    if entry is None:
+                        pending[(id(bot), chat_id)] = [
+                            time.monotonic() + BATCH_FLUSH_DELAY, bot, [text], [future]
+                        ]
+                    else:
+                        entry[2].append(text)
+                        entry[3].append(future)
+                else:
+                    # Send anything still held for this chat first to keep its order
+                    entry = pending.pop((id(bot), chat_id), None)
+                    if entry is not None:
+                        self._flush(entry[1], chat_id, entry[2], entry[3])
+                    self._send(bot, chat_id, text, kwargs, [future])
+            
+            now = time.monotonic()
+            for key in [k for k, entry in pending.items() if entry[0] <= now]:
+                _, bot, texts, futures = pending.pop(key)
+                self._flush(bot, key[1], texts, futures)
+    
+    def _flush(self, bot, chat_id, texts, futures):
+        chunk, chunk_futures, size = [], [], 0
+        for text, future in zip(texts, futures):
+            if chunk and size + 2 + len(text) > BATCH_MAX_CHARS:
+                self._send(bot, chat_id, '\n\n'.join(chunk), {}, chunk_futures)
+                chunk, chunk_futures, size = [], [], 0
+            chunk.append(text)
+            chunk_futures.append(future)
+            size += len(text) + (2 if size else 0)
+        if chunk:
+            self._send(bot, chat_id, '\n\n'.join(chunk), {}, chunk_futures)
+    
+    @staticmethod
+    def _send(bot, chat_id, text, kwargs, futures):
+        try:
+            _send_limiter(bot).acquire()
+            result = safe_send_html(bot, chat_id, text, **kwargs)
+        except Exception as e:
+            logging.error(f"Failed to send message to {chat_id}: {e}")
+            result = False
+        for future in futures:
+            future.set_result(result)
+
+
+_batch_sender = _BatchSender()
+
+
+# Fallback digest cache for markups that reject attribute writes
+_keyboard_digests = weakref.WeakKeyDictionary()
+
+
+def _keyboard_digest(keyboard: InlineKeyboardMarkup) -> int:
+    """Hash a keyboard's buttons, memoized on the markup object.
+    
+    Markups are treated as immutable once built, so re-editing with the
+    same markup object skips walking its buttons again.
+    """
+    cached = getattr(keyboard, '_cached_view_hash', None)
+    if cached is not None:
+        return cached
+    try:
+        cached = _keyboard_digests.get(keyboard)
+    except TypeError:
+        cached = None
+    if cached is not None:
+        return cached
+    
+    # Feed buttons straight into the hasher; ASCII group (0x1d), record
+    # (0x1e) and unit (0x1f) separators keep rows and fields unambiguous
+    hasher = _new_view_hasher()
+    update = hasher.update
+    for row in keyboard.inline_keyboard:
+        update(b'\x1d')
+        for button in row:
+            update(button.text.encode('utf-8'))
+            update(b'\x1f')
+            update((button.callback_data or button.url or '').encode('utf-8'))
+            update(b'\x1e')
+    digest = _hasher_int(hasher)
+    
+    try:
+        object.__setattr__(keyboard, '_cached_view_hash', digest)
+    except (AttributeError, TypeError):
+        try:
+            _keyboard_digests[keyboard] = digest
+        except TypeError:
+            pass  # Not weak-referenceable; just don't cache
+    return digest
+
+
+def compute_view_key(text: str, keyboard: InlineKeyboardMarkup = None) -> int:
     """Compute a stable hash key for a view (text + keyboard).
     
-    This is used for de-duplication to avoid redundant edits.
-    Uses SHA-256 for better security practices.
+    This is used for de-duplication to avoid redundant edits. The key only
+    lives in chat_data, so a fast non-cryptographic hash (xxh3, or blake2b
+    when xxhash is not installed) is sufficient; VIEW_HASH_CRYPTO switches
+    to blake3/blake2b.
     
     Args:
         text: Message text
         keyboard: InlineKeyboardMarkup (optional)
     
     Returns:
-        str: SHA-256 hash of the view
+        int: 64-bit hash of the view
     """
-    content = text
-    if keyboard:
-        # Serialize keyboard to stable string representation
-        kb_data = []
-        for row in keyboard.inline_keyboard:
-            row_data = []
-            for button in row:
-                # Include text and callback_data/url
-                row_data.append((button.text, button.callback_data or button.url or ''))
-            kb_data.append(tuple(row_data))
-        content += str(tuple(kb_data))
+    return _view_key(text, _keyboard_digest(keyboard) if keyboard else None)
+
+
+def _view_key(text: str, keyboard_digest: int = None) -> int:
+    """Combine a text with an already computed keyboard digest."""
+    hasher = _new_view_hasher()
+    hasher.update(text.encode('utf-8'))
+    if keyboard_digest is not None:
+        hasher.update(keyboard_digest.to_bytes(8, 'big'))
     
-    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+    return _hasher_int(hasher)
+
+
+def _btn_id(button, _getattr=getattr):
+    """Unique identifier for a button: callback_data, else url, else text."""
+    return _getattr(button, 'callback_data', None) or _getattr(button, 'url', None) or button.text
 
 
 def deduplicate_keyboard(keyboard: InlineKeyboardMarkup) -> InlineKeyboardMarkup:
@@ -104,21 +402,47 @@ def deduplicate_keyboard(keyboard: InlineKeyboardMarkup) -> InlineKeyboardMarkup
         return keyboard
     
     new_rows = []
+    changed = False
+    btn_id = _btn_id  # local binding for the hot loop
     for row in keyboard.inline_keyboard:
-        seen = set()
-        new_row = []
-        for button in row:
-            # Use callback_data or url as unique identifier
-            identifier = button.callback_data or button.url or button.text
-            if identifier not in seen:
-                seen.add(identifier)
-                new_row.append(button)
-        if new_row:
-            new_rows.append(new_row)
+        if not row:
+            changed = True
+            continue
+        # Use callback_data or url as unique identifier
+        ids = [btn_id(button) for button in row]
+        if len(dict.fromkeys(ids)) == len(row):
+            # No duplicates: keep the original row object
+            new_rows.append(row)
+            continue
+        # Keep the first button for each identifier, in order
+        first = {}
+        for identifier, button in zip(ids, row):
+            first.setdefault(identifier, button)
+        new_rows.append(list(first.values()))
+        changed = True
     
+    # Reuse the original markup when nothing was removed so its cached
+    # view digest stays valid
+    if not changed:
+        return keyboard
     return InlineKeyboardMarkup(new_rows)
 
 
+# Seconds during which repeated unchanged-view taps get an empty answer
+UNCHANGED_VIEW_ANSWER_WINDOW = 0.5
+
+
+def _answer_once(query, *args, **kwargs):
+    """Answer a callback query unless this helper already answered it."""
+    if getattr(query, '_answered', False):
+        return
+    query.answer(*args, **kwargs)
+    try:
+        object.__setattr__(query, '_answered', True)
+    except (AttributeError, TypeError):
+        pass
+
+
 def safe_edit_message_text(query, text, parse_mode='HTML', reply_markup=None, 
                            context=None, view_name=None, **kwargs):
     """Safely edit a message, handling 'Message is not modified' errors.
@@ -145,22 +469,41 @@ def safe_edit_message_text(query, text, parse_mode='HTML', reply_markup=None,
     
     # Check if view is unchanged (de-duplication)
     if context and view_name:
-        view_key = compute_view_key(text, reply_markup)
-        
         # Initialize chat_data if needed
         if not hasattr(context, 'chat_data') or context.chat_data is None:
             context.chat_data = {}
         
+        # Same markup object as the last render of this view: reuse its
+        # digest and only hash the text
+        keyboard_digest = None
+        if reply_markup:
+            kb_slot = f'view_kb_{view_name}'
+            cached = context.chat_data.get(kb_slot)
+            if cached is not None and cached[0]() is reply_markup:
+                keyboard_digest = cached[1]
+            else:
+                keyboard_digest = _keyboard_digest(reply_markup)
+                try:
+                    context.chat_data[kb_slot] = (weakref.ref(reply_markup), keyboard_digest)
+                except TypeError:
+                    pass  # Not weak-referenceable
+        view_key = _view_key(text, keyboard_digest)
+        
         stored_key = context.chat_data.get(f'view_key_{view_name}')
         
         if stored_key == view_key:
-            # View hasn't changed, just answer callback
+            # View hasn't changed, just answer callback. Repeated taps within
+            # UNCHANGED_VIEW_ANSWER_WINDOW get the cheapest empty answer.
+            now = time.monotonic()
+            answered_key = f'view_ans_{view_name}'
+            last_answered = context.chat_data.get(answered_key)
             try:
-                lang = context.chat_data.get('lang', 'zh')
-                if lang == 'zh':
-                    query.answer("已是最新", show_alert=False)
+                if last_answered is not None and now - last_answered < UNCHANGED_VIEW_ANSWER_WINDOW:
+                    _answer_once(query)
                 else:
-                    query.answer("Up to date", show_alert=False)
+                    lang = context.chat_data.get('lang', 'zh')
+                    _answer_once(query, "已是最新" if lang == 'zh' else "Up to date", show_alert=False)
+                context.chat_data[answered_key] = now
             except TelegramError as e:
                 logging.debug(f"Could not answer callback for unchanged view: {e}")
             return True
@@ -192,9 +535,9 @@ def safe_edit_message_text(query, text, parse_mode='HTML', reply_markup=None,
                 except Exception as e2:
                     logging.debug(f"Could not update reply markup: {e2}")
             
-            # Answer callback to acknowledge
+            # Answer callback to acknowledge (skipped if already answered)
             try:
-                query.answer()
+                _answer_once(query)
             except TelegramError as e_answer:
                 logging.debug(f"Could not answer callback: {e_answer}")
             
@@ -225,8 +568,8 @@ def maybe_answer_latest(query, lang='zh'):
     """
     try:
         if lang == 'zh':
-            query.answer("已是最新", show_alert=False)
+            _answer_once(query, "已是最新", show_alert=False)
         else:
-            query.answer("Up to date", show_alert=False)
+            _answer_once(query, "Up to date", show_alert=False)
     except (TelegramError, BadRequest) as e:
         logging.debug(f"Could not answer callback: {e}")
@@ -8,12 +8,13 @@ from decimal import Decimal
 from models.constants import MARKUP_TYPE_FIXED, MARKUP_TYPE_PERCENT
 
 
-def apply_markup(base_price: float, agent: dict = None) -> float:
+def apply_markup(base_price: float, agent: dict = None, precise: bool = False) -> float:
     """Apply price markup based on agent configuration.
     
     Args:
         base_price: The base price of the item.
         agent: Agent document from database (optional, if None returns base price).
+        precise: Compute with Decimal instead of float arithmetic.
     
     Returns:
         float: The final price after applying markup.
@@ -25,6 +26,27 @@ def apply_markup(base_price: float, agent: dict = None) -> float:
     markup_type = pricing.get('markup_type', MARKUP_TYPE_PERCENT)
     markup_value = pricing.get('markup_value', 0)
     
+    if precise:
+        return _apply_markup_decimal(base_price, markup_type, markup_value)
+    
+    try:
+        if markup_type == MARKUP_TYPE_FIXED:
+            # Fixed amount markup
+            return round(float(base_price) + float(markup_value), 2)
+        elif markup_type == MARKUP_TYPE_PERCENT:
+            # Percentage markup
+            return round(float(base_price) * (1.0 + float(markup_value) * 0.01), 2)
+        else:
+            logging.warning(f"Unknown markup type: {markup_type}, using base price")
+            return round(float(base_price), 2)
+        
+    except Exception as e:
+        logging.error(f"Error applying markup: {e}, using base price")
+        return base_price
+
+
+def _apply_markup_decimal(base_price: float, markup_type: str, markup_value) -> float:
+    """Decimal-exact variant of apply_markup."""
     try:
         base = Decimal(str(base_price))
         markup = Decimal(str(markup_value))
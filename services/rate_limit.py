@@ -0,0 +1,27 @@
+"""Thread-safe rate limiting shared by the bot and the payment server."""
+
+import threading
+import time
+
+
+class RateLimiter:
+    """Token bucket letting through at most `rate` calls per second on average."""
+
+    def __init__(self, rate: float):
+        self.rate = max(1, rate)
+        self._tokens = float(self.rate)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
@@ -6,76 +6,84 @@ only matching valid country names, ISO codes, and phone country codes.
 
 import re
 import logging
+from bisect import bisect_left
+from collections import namedtuple
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Final, List, Mapping, Optional, Tuple
 
+try:
+    import marisa_trie
+except ImportError:
+    marisa_trie = None
 
-# Country data with ISO codes, phone codes, and names in zh/en
-COUNTRY_DATA = {
+
+# Country data with ISO codes, phone codes, and names in zh/en (read-only)
+COUNTRY_DATA: Final[Mapping[str, Tuple[str, str, str, Tuple[str, ...], Tuple[str, ...]]]] = MappingProxyType({
     # ISO code -> (phone_code, zh_name, en_name, aliases_zh, aliases_en)
-    'AR': ('54', '阿根廷', 'Argentina', ['阿根廷'], ['argentina', 'arg']),
-    'US': ('1', '美国', 'United States', ['美国', '美利坚'], ['usa', 'united states', 'us', 'america']),
-    'GB': ('44', '英国', 'United Kingdom', ['英国'], ['uk', 'united kingdom', 'britain', 'great britain']),
-    'CN': ('86', '中国', 'China', ['中国'], ['china', 'cn', 'prc']),
-    'JP': ('81', '日本', 'Japan', ['日本'], ['japan', 'jp']),
-    'KR': ('82', '韩国', 'South Korea', ['韩国', '南韩'], ['korea', 'south korea', 'sk', 'rok']),
-    'DE': ('49', '德国', 'Germany', ['德国'], ['germany', 'de']),
-    'FR': ('33', '法国', 'France', ['法国'], ['france', 'fr']),
-    'IT': ('39', '意大利', 'Italy', ['意大利'], ['italy', 'it']),
-    'ES': ('34', '西班牙', 'Spain', ['西班牙'], ['spain', 'es']),
-    'CA': ('1', '加拿大', 'Canada', ['加拿大'], ['canada', 'ca']),
-    'AU': ('61', '澳大利亚', 'Australia', ['澳大利亚', '澳洲'], ['australia', 'aus', 'oz']),
-    'BR': ('55', '巴西', 'Brazil', ['巴西'], ['brazil', 'br']),
-    'MX': ('52', '墨西哥', 'Mexico', ['墨西哥'], ['mexico', 'mx']),
-    'IN': ('91', '印度', 'India', ['印度'], ['india', 'in']),
-    'RU': ('7', '俄罗斯', 'Russia', ['俄罗斯'], ['russia', 'ru']),
-    'ZA': ('27', '南非', 'South Africa', ['南非'], ['south africa', 'za']),
-    'NL': ('31', '荷兰', 'Netherlands', ['荷兰'], ['netherlands', 'nl', 'holland']),
-    'SE': ('46', '瑞典', 'Sweden', ['瑞典'], ['sweden', 'se']),
-    'NO': ('47', '挪威', 'Norway', ['挪威'], ['norway', 'no']),
-    'PL': ('48', '波兰', 'Poland', ['波兰'], ['poland', 'pl']),
-    'TR': ('90', '土耳其', 'Turkey', ['土耳其'], ['turkey', 'tr']),
-    'SA': ('966', '沙特阿拉伯', 'Saudi Arabia', ['沙特', '沙特阿拉伯'], ['saudi arabia', 'saudi', 'sa', 'ksa']),
-    'AE': ('971', '阿联酋', 'United Arab Emirates', ['阿联酋', '阿拉伯联合酋长国'], ['uae', 'united arab emirates', 'emirates']),
-    'SG': ('65', '新加坡', 'Singapore', ['新加坡'], ['singapore', 'sg']),
-    'MY': ('60', '马来西亚', 'Malaysia', ['马来西亚'], ['malaysia', 'my']),
-    'TH': ('66', '泰国', 'Thailand', ['泰国'], ['thailand', 'th']),
-    'VN': ('84', '越南', 'Vietnam', ['越南'], ['vietnam', 'vn']),
-    'PH': ('63', '菲律宾', 'Philippines', ['菲律宾'], ['philippines', 'ph']),
-    'ID': ('62', '印度尼西亚', 'Indonesia', ['印尼', '印度尼西亚'], ['indonesia', 'id']),
-    'PK': ('92', '巴基斯坦', 'Pakistan', ['巴基斯坦'], ['pakistan', 'pk']),
-    'BD': ('880', '孟加拉国', 'Bangladesh', ['孟加拉', '孟加拉国'], ['bangladesh', 'bd']),
-    'EG': ('20', '埃及', 'Egypt', ['埃及'], ['egypt', 'eg']),
-    'NG': ('234', '尼日利亚', 'Nigeria', ['尼日利亚'], ['nigeria', 'ng']),
-    'IL': ('972', '以色列', 'Israel', ['以色列'], ['israel', 'il']),
-    'GR': ('30', '希腊', 'Greece', ['希腊'], ['greece', 'gr']),
-    'PT': ('351', '葡萄牙', 'Portugal', ['葡萄牙'], ['portugal', 'pt']),
-    'CZ': ('420', '捷克', 'Czech Republic', ['捷克'], ['czech', 'czech republic', 'cz']),
-    'AT': ('43', '奥地利', 'Austria', ['奥地利'], ['austria', 'at']),
-    'CH': ('41', '瑞士', 'Switzerland', ['瑞士'], ['switzerland', 'ch']),
-    'BE': ('32', '比利时', 'Belgium', ['比利时'], ['belgium', 'be']),
-    'DK': ('45', '丹麦', 'Denmark', ['丹麦'], ['denmark', 'dk']),
-    'FI': ('358', '芬兰', 'Finland', ['芬兰'], ['finland', 'fi']),
-    'IE': ('353', '爱尔兰', 'Ireland', ['爱尔兰'], ['ireland', 'ie']),
-    'NZ': ('64', '新西兰', 'New Zealand', ['新西兰'], ['new zealand', 'nz']),
-    'LK': ('94', '斯里兰卡', 'Sri Lanka', ['斯里兰卡'], ['sri lanka', 'lk']),
-    'HK': ('852', '香港', 'Hong Kong', ['香港'], ['hong kong', 'hk']),
-    'TW': ('886', '台湾', 'Taiwan', ['台湾'], ['taiwan', 'tw']),
-    'MO': ('853', '澳门', 'Macau', ['澳门'], ['macau', 'mo']),
-}
+    'AR': ('54', '阿根廷', 'Argentina', ('阿根廷',), ('argentina', 'arg')),
+    'US': ('1', '美国', 'United States', ('美国', '美利坚'), ('usa', 'united states', 'us', 'america')),
+    'GB': ('44', '英国', 'United Kingdom', ('英国',), ('uk', 'united kingdom', 'britain', 'great britain')),
+    'CN': ('86', '中国', 'China', ('中国',), ('china', 'cn', 'prc')),
+    'JP': ('81', '日本', 'Japan', ('日本',), ('japan', 'jp')),
+    'KR': ('82', '韩国', 'South Korea', ('韩国', '南韩'), ('korea', 'south korea', 'sk', 'rok')),
+    'DE': ('49', '德国', 'Germany', ('德国',), ('germany', 'de')),
+    'FR': ('33', '法国', 'France', ('法国',), ('france', 'fr')),
+    'IT': ('39', '意大利', 'Italy', ('意大利',), ('italy', 'it')),
+    'ES': ('34', '西班牙', 'Spain', ('西班牙',), ('spain', 'es')),
+    'CA': ('1', '加拿大', 'Canada', ('加拿大',), ('canada', 'ca')),
+    'AU': ('61', '澳大利亚', 'Australia', ('澳大利亚', '澳洲'), ('australia', 'aus', 'oz')),
+    'BR': ('55', '巴西', 'Brazil', ('巴西',), ('brazil', 'br')),
+    'MX': ('52', '墨西哥', 'Mexico', ('墨西哥',), ('mexico', 'mx')),
+    'IN': ('91', '印度', 'India', ('印度',), ('india', 'in')),
+    'RU': ('7', '俄罗斯', 'Russia', ('俄罗斯',), ('russia', 'ru')),
+    'ZA': ('27', '南非', 'South Africa', ('南非',), ('south africa', 'za')),
+    'NL': ('31', '荷兰', 'Netherlands', ('荷兰',), ('netherlands', 'nl', 'holland')),
+    'SE': ('46', '瑞典', 'Sweden', ('瑞典',), ('sweden', 'se')),
+    'NO': ('47', '挪威', 'Norway', ('挪威',), ('norway', 'no')),
+    'PL': ('48', '波兰', 'Poland', ('波兰',), ('poland', 'pl')),
+    'TR': ('90', '土耳其', 'Turkey', ('土耳其',), ('turkey', 'tr')),
+    'SA': ('966', '沙特阿拉伯', 'Saudi Arabia', ('沙特', '沙特阿拉伯'), ('saudi arabia', 'saudi', 'sa', 'ksa')),
+    'AE': ('971', '阿联酋', 'United Arab Emirates', ('阿联酋', '阿拉伯联合酋长国'), ('uae', 'united arab emirates', 'emirates')),
+    'SG': ('65', '新加坡', 'Singapore', ('新加坡',), ('singapore', 'sg')),
+    'MY': ('60', '马来西亚', 'Malaysia', ('马来西亚',), ('malaysia', 'my')),
+    'TH': ('66', '泰国', 'Thailand', ('泰国',), ('thailand', 'th')),
+    'VN': ('84', '越南', 'Vietnam', ('越南',), ('vietnam', 'vn')),
+    'PH': ('63', '菲律宾', 'Philippines', ('菲律宾',), ('philippines', 'ph')),
+    'ID': ('62', '印度尼西亚', 'Indonesia', ('印尼', '印度尼西亚'), ('indonesia', 'id')),
+    'PK': ('92', '巴基斯坦', 'Pakistan', ('巴基斯坦',), ('pakistan', 'pk')),
+    'BD': ('880', '孟加拉国', 'Bangladesh', ('孟加拉', '孟加拉国'), ('bangladesh', 'bd')),
+    'EG': ('20', '埃及', 'Egypt', ('埃及',), ('egypt', 'eg')),
+    'NG': ('234', '尼日利亚', 'Nigeria', ('尼日利亚',), ('nigeria', 'ng')),
+    'IL': ('972', '以色列', 'Israel', ('以色列',), ('israel', 'il')),
+    'GR': ('30', '希腊', 'Greece', ('希腊',), ('greece', 'gr')),
+    'PT': ('351', '葡萄牙', 'Portugal', ('葡萄牙',), ('portugal', 'pt')),
+    'CZ': ('420', '捷克', 'Czech Republic', ('捷克',), ('czech', 'czech republic', 'cz')),
+    'AT': ('43', '奥地利', 'Austria', ('奥地利',), ('austria', 'at')),
+    'CH': ('41', '瑞士', 'Switzerland', ('瑞士',), ('switzerland', 'ch')),
+    'BE': ('32', '比利时', 'Belgium', ('比利时',), ('belgium', 'be')),
+    'DK': ('45', '丹麦', 'Denmark', ('丹麦',), ('denmark', 'dk')),
+    'FI': ('358', '芬兰', 'Finland', ('芬兰',), ('finland', 'fi')),
+    'IE': ('353', '爱尔兰', 'Ireland', ('爱尔兰',), ('ireland', 'ie')),
+    'NZ': ('64', '新西兰', 'New Zealand', ('新西兰',), ('new zealand', 'nz')),
+    'LK': ('94', '斯里兰卡', 'Sri Lanka', ('斯里兰卡',), ('sri lanka', 'lk')),
+    'HK': ('852', '香港', 'Hong Kong', ('香港',), ('hong kong', 'hk')),
+    'TW': ('886', '台湾', 'Taiwan', ('台湾',), ('taiwan', 'tw')),
+    'MO': ('853', '澳门', 'Macau', ('澳门',), ('macau', 'mo')),
+})
 
 
 # Build reverse lookup indexes
-# Note: _PHONE_TO_ISO maps to a list of ISOs since multiple countries can share a phone code
-_PHONE_TO_ISO = {}
-_ZH_NAME_TO_ISO = {}
-_EN_NAME_TO_ISO = {}
-_ZH_ALIAS_TO_ISO = {}
-_EN_ALIAS_TO_ISO = {}
+# Note: _PHONE_TO_ISO maps to a tuple of ISOs since multiple countries can share a phone code
+_PHONE_TO_ISO: Final[Dict[str, Tuple[str, ...]]] = {}
+_ZH_NAME_TO_ISO: Final[Dict[str, str]] = {}
+_EN_NAME_TO_ISO: Final[Dict[str, str]] = {}
+_ZH_ALIAS_TO_ISO: Final[Dict[str, str]] = {}
+_EN_ALIAS_TO_ISO: Final[Dict[str, str]] = {}
 
 for iso, (phone, zh_name, en_name, zh_aliases, en_aliases) in COUNTRY_DATA.items():
     # Handle multiple countries with same phone code (e.g., US and CA both use '1')
-    if phone not in _PHONE_TO_ISO:
-        _PHONE_TO_ISO[phone] = []
-    _PHONE_TO_ISO[phone].append(iso)
+    _PHONE_TO_ISO[phone] = _PHONE_TO_ISO.get(phone, ()) + (iso,)
     
     _ZH_NAME_TO_ISO[zh_name.lower()] = iso
     _EN_NAME_TO_ISO[en_name.lower()] = iso
@@ -84,6 +92,105 @@ for iso, (phone, zh_name, en_name, zh_aliases, en_aliases) in COUNTRY_DATA.items
     for alias in en_aliases:
         _EN_ALIAS_TO_ISO[alias.lower()] = iso
 
+# All names and aliases (zh/en, lowercased) -> ISO code in one dict;
+# setdefault keeps the zh name, en name, zh alias, en alias precedence
+_NAME_TO_ISO: Final[Dict[str, str]] = {}
+for _index in (_ZH_NAME_TO_ISO, _EN_NAME_TO_ISO, _ZH_ALIAS_TO_ISO, _EN_ALIAS_TO_ISO):
+    for _key, iso in _index.items():
+        _NAME_TO_ISO.setdefault(_key, iso)
+
+# Flat index of every accepted query form (lowercased ISO code, phone code,
+# zh/en names and aliases) -> ISO code, so a lookup is a single dict hit.
+# setdefault keeps the precedence get_country_info has always used:
+# ISO code, phone code (first country), zh name, en name, zh alias, en alias.
+_QUERY_TO_ISO: Final[Dict[str, str]] = {}
+for iso in COUNTRY_DATA:
+    _QUERY_TO_ISO.setdefault(iso.lower(), iso)
+for phone, isos in _PHONE_TO_ISO.items():
+    _QUERY_TO_ISO.setdefault(phone, isos[0])
+for _key, iso in _NAME_TO_ISO.items():
+    _QUERY_TO_ISO.setdefault(_key, iso)
+
+
+# Prefix index over every accepted query form for suggest_country: a
+# marisa-trie when installed, otherwise a sorted key list searched with bisect
+_SORTED_QUERIES: Final[List[str]] = sorted(_QUERY_TO_ISO)
+_QUERY_TRIE: Final = marisa_trie.Trie(_SORTED_QUERIES) if marisa_trie is not None else None
+
+
+# Immutable country info returned by get_country_info, built once per ISO code
+CountryInfo = namedtuple('CountryInfo', 'iso phone zh_name en_name')
+_COUNTRY_INFO: Final[Dict[str, CountryInfo]] = {
+    iso: CountryInfo(iso, phone, zh_name, en_name)
+    for iso, (phone, zh_name, en_name, _, _) in COUNTRY_DATA.items()
+}
+
+
+# Phone codes are 1-4 ASCII digits, optionally preceded by '+' signs
+_PHONE_RE: Final = re.compile(r'\+*([0-9]{1,4})')
+_ISO_SET: Final = frozenset(COUNTRY_DATA)
+
+
+def _lookup_iso(text: str) -> Optional[str]:
+    """Resolve a stripped query to its ISO code via the flat index.
+    
+    A leading '+' is only accepted in front of a phone code.
+    
+    Returns:
+        str: ISO code, or None if the query is not a known country form
+    """
+    if text.startswith('+'):
+        match = _PHONE_RE.fullmatch(text)
+        return _QUERY_TO_ISO.get(match.group(1)) if match else None
+    return _QUERY_TO_ISO.get(text.lower())
+
+
+# Raw inputs longer than this skip the resolve cache so arbitrary chat
+# messages don't evict the handful of country queries users repeat
+_RESOLVE_CACHE_MAX_LEN = 64
+
+
+@lru_cache(maxsize=4096)
+def _resolve_str(text: str) -> Optional[str]:
+    """Resolve a raw query string to its ISO code (cached)."""
+    text = text.strip()
+    
+    # Check length constraints
+    if len(text) == 0 or len(text) > 30:
+        return None
+    
+    return _lookup_iso(text)
+
+
+def _resolve_query(text) -> Optional[str]:
+    """Validate and resolve a raw country query in one pass.
+    
+    Returns:
+        str: ISO code, or None if text is not a valid country query
+    """
+    if not text or not isinstance(text, str):
+        return None
+    
+    if len(text) > _RESOLVE_CACHE_MAX_LEN:
+        return _resolve_str.__wrapped__(text)
+    return _resolve_str(text)
+
+
+def _is_valid_iso_code_norm(stripped: str) -> bool:
+    """is_valid_iso_code for already-stripped text."""
+    return len(stripped) == 2 and stripped.upper() in _ISO_SET
+
+
+def _is_valid_phone_code_norm(stripped: str) -> bool:
+    """is_valid_phone_code for already-stripped text."""
+    match = _PHONE_RE.fullmatch(stripped)
+    return match is not None and match.group(1) in _PHONE_TO_ISO
+
+
+def _is_valid_country_name_norm(lowered: str) -> bool:
+    """is_valid_country_name for already-stripped, lowercased text."""
+    return lowered in _NAME_TO_ISO
+
 
 def is_valid_iso_code(text: str) -> bool:
     """Check if text is a valid ISO 3166-1 alpha-2 country code.
@@ -94,8 +201,7 @@ def is_valid_iso_code(text: str) -> bool:
     Returns:
         bool: True if valid ISO code
     """
-    normalized = text.strip().upper()
-    return len(normalized) == 2 and normalized in COUNTRY_DATA
+    return _is_valid_iso_code_norm(text.strip())
 
 
 def is_valid_phone_code(text: str) -> bool:
@@ -109,8 +215,7 @@ def is_valid_phone_code(text: str) -> bool:
     Returns:
         bool: True if valid phone code
     """
-    normalized = text.strip().lstrip('+')
-    return normalized.isdigit() and normalized in _PHONE_TO_ISO
+    return _is_valid_phone_code_norm(text.strip())
 
 
 def is_valid_country_name(text: str) -> bool:
@@ -122,11 +227,7 @@ def is_valid_country_name(text: str) -> bool:
     Returns:
         bool: True if matches a country name
     """
-    normalized = text.strip().lower()
-    return (normalized in _ZH_NAME_TO_ISO or 
-            normalized in _EN_NAME_TO_ISO or 
-            normalized in _ZH_ALIAS_TO_ISO or 
-            normalized in _EN_ALIAS_TO_ISO)
+    return _is_valid_country_name_norm(text.strip().lower())
 
 
 def is_valid_country_query(text: str) -> bool:
@@ -143,19 +244,7 @@ def is_valid_country_query(text: str) -> bool:
     Returns:
         bool: True if valid country query
     """
-    if not text or not isinstance(text, str):
-        return False
-    
-    text = text.strip()
-    
-    # Check length constraints
-    if len(text) == 0 or len(text) > 30:
-        return False
-    
-    # Check each validation type
-    return (is_valid_iso_code(text) or 
-            is_valid_phone_code(text) or 
-            is_valid_country_name(text))
+    return _resolve_query(text) is not None
 
 
 def normalize_country_query(text: str) -> str:
@@ -171,62 +260,68 @@ def normalize_country_query(text: str) -> str:
     """
     text = text.strip()
     
-    # For ISO codes, return uppercase
-    if is_valid_iso_code(text):
-        return text.upper()
+    # For ISO codes, return uppercase (cased once, reused for the check)
+    if len(text) == 2:
+        upper = text.upper()
+        if upper in _ISO_SET:
+            return upper
     
-    # For phone codes, remove leading +
-    if is_valid_phone_code(text):
-        return text.lstrip('+')
+    # For phone codes, return the matched digits (leading + removed)
+    match = _PHONE_RE.fullmatch(text)
+    if match is not None:
+        digits = match.group(1)
+        if digits in _PHONE_TO_ISO:
+            return digits
     
     # For names, return lowercase
     return text.lower()
 
 
-def get_country_info(text: str) -> dict:
+def get_country_info(text: str) -> Optional[CountryInfo]:
     """Get country information from a query.
     
     Args:
         text: Country query (name, ISO code, or phone code)
     
     Returns:
-        dict: Country info with keys: iso, phone, zh_name, en_name
-              Returns None if not found
+        CountryInfo: Shared namedtuple with fields iso, phone, zh_name, en_name
+                     (use ``._asdict()`` for a dict). Returns None if not found
     """
-    if not is_valid_country_query(text):
-        return None
+    iso_code = _resolve_query(text)
+    return _COUNTRY_INFO[iso_code] if iso_code is not None else None
+
+
+def suggest_country(prefix: str, limit: int = 5) -> List[str]:
+    """Suggest country query forms starting with a prefix.
+    
+    Matches against the same forms is_valid_country_query accepts
+    (lowercased names/aliases, ISO codes and phone codes), e.g. "arg" ->
+    ["arg", "argentina"]. Exact-match validation is unaffected.
+    
+    Args:
+        prefix: Partial query text
+        limit: Maximum number of suggestions
+    
+    Returns:
+        list: Up to ``limit`` matching query forms in sorted order
+    """
+    if not prefix or not isinstance(prefix, str) or limit <= 0:
+        return []
+    
+    prefix = prefix.strip().lower().lstrip('+')
+    if not prefix:
+        return []
+    
+    if _QUERY_TRIE is not None:
+        return sorted(_QUERY_TRIE.keys(prefix))[:limit]
     
-    normalized = normalize_country_query(text)
-    iso_code = None
-    
-    # Try ISO code
-    if normalized.upper() in COUNTRY_DATA:
-        iso_code = normalized.upper()
-    # Try phone code - now returns first matching country from the list
-    elif normalized in _PHONE_TO_ISO:
-        iso_codes = _PHONE_TO_ISO[normalized]
-        # Return first country with this phone code
-        iso_code = iso_codes[0] if iso_codes else None
-    # Try names and aliases
-    elif normalized in _ZH_NAME_TO_ISO:
-        iso_code = _ZH_NAME_TO_ISO[normalized]
-    elif normalized in _EN_NAME_TO_ISO:
-        iso_code = _EN_NAME_TO_ISO[normalized]
-    elif normalized in _ZH_ALIAS_TO_ISO:
-        iso_code = _ZH_ALIAS_TO_ISO[normalized]
-    elif normalized in _EN_ALIAS_TO_ISO:
-        iso_code = _EN_ALIAS_TO_ISO[normalized]
-    
-    if iso_code and iso_code in COUNTRY_DATA:
-        phone, zh_name, en_name, _, _ = COUNTRY_DATA[iso_code]
-        return {
-            'iso': iso_code,
-            'phone': phone,
-            'zh_name': zh_name,
-            'en_name': en_name
-        }
-    
-    return None
+    matches = []
+    start = bisect_left(_SORTED_QUERIES, prefix)
+    for key in _SORTED_QUERIES[start:start + limit]:
+        if not key.startswith(prefix):
+            break
+        matches.append(key)
+    return matches
 
 
 def should_trigger_search(text: str) -> bool:
@@ -5,6 +5,9 @@ particularly in multi-tenant agent environments.
 """
 
 import logging
+import re
+from functools import lru_cache
+from types import MappingProxyType
 from typing import Dict, Any, List
 
 
@@ -43,6 +46,60 @@ SENSITIVE_KEYS = [
     'payload',
 ]
 
+# One alternation over all sensitive substrings, searched in C instead of a
+# per-key any() loop
+_SENSITIVE_RE = re.compile('|'.join(re.escape(k) for k in SENSITIVE_KEYS))
+
+# Exact sensitive key names: one hash lookup before falling back to the
+# substring regex (needed for compound names like user_account_data)
+_SENSITIVE_EXACT = frozenset(SENSITIVE_KEYS)
+
+# Non-sensitive item fields; none of them match a sensitive substring, so
+# they short-circuit the item key check
+_ITEM_ALLOWED_FIELDS = frozenset([
+    'product_id',
+    'product_name',
+    'category',
+    'quantity',
+    'qty',
+    'unit_price',
+    'price',
+    'subtotal',
+    'total',
+    'sku',
+    'description',
+])
+
+# Extra substrings that mark an item field as a deliverable
+_ITEM_PAYLOAD_RE = re.compile('payload|data')
+
+
+# Order documents share a schema, so the same key names are classified over
+# and over when redacting a page of orders; cache the verdict per key
+@lru_cache(maxsize=1024)
+def _is_sensitive_key(key: str) -> bool:
+    """Check if a top-level order key holds sensitive data."""
+    key_lower = key.lower()
+    return key_lower in _SENSITIVE_EXACT or _SENSITIVE_RE.search(key_lower) is not None
+
+
+@lru_cache(maxsize=1024)
+def _is_sensitive_item_key(key: str) -> bool:
+    """Check if an order item key holds sensitive data or deliverables."""
+    key_lower = key.lower()
+    if key_lower in _ITEM_ALLOWED_FIELDS:
+        return False
+    return _is_sensitive_key(key) or _ITEM_PAYLOAD_RE.search(key_lower) is not None
+
+
+_REDACTION_NOTE = "Sensitive customer data redacted for agent viewing"
+
+# Shared, read-only marker merged into every redacted copy
+_REDACTION_MARKER = MappingProxyType({
+    '_redacted': True,
+    '_redaction_note': _REDACTION_NOTE,
+})
+
 
 def redact_order_payload(order_doc: Dict[str, Any], is_child_agent: bool = True) -> Dict[str, Any]:
     """Redact sensitive fields from an order document for child agent viewing.
@@ -65,46 +122,31 @@ def redact_order_payload(order_doc: Dict[str, Any], is_child_agent: bool = True)
     if not order_doc:
         return order_doc
     
+    sensitive_keys = [key for key in order_doc if _is_sensitive_key(key)]
+    items = order_doc.get('items')
+    if not sensitive_keys and not isinstance(items, list):
+        # Nothing to redact: build the marked copy in one step
+        return {**order_doc, **_REDACTION_MARKER}
+    
     # Create a shallow copy to avoid modifying original
     redacted = dict(order_doc)
     
     # Remove sensitive top-level keys
-    for key in list(redacted.keys()):
-        key_lower = key.lower()
-        if any(sensitive in key_lower for sensitive in SENSITIVE_KEYS):
-            redacted[key] = "**REDACTED**"
-            logging.debug(f"Redacted sensitive key: {key}")
+    for key in sensitive_keys:
+        redacted[key] = "**REDACTED**"
+        logging.debug(f"Redacted sensitive key: {key}")
     
     # Handle nested items array (common in order documents)
-    if 'items' in redacted and isinstance(redacted['items'], list):
+    if isinstance(redacted.get('items'), list):
         redacted_items = []
         for item in redacted['items']:
             if isinstance(item, dict):
                 redacted_item = dict(item)
                 
-                # Keep only non-sensitive fields
-                allowed_fields = [
-                    'product_id',
-                    'product_name',
-                    'category',
-                    'quantity',
-                    'qty',
-                    'unit_price',
-                    'price',
-                    'subtotal',
-                    'total',
-                    'sku',
-                    'description',
-                ]
-                
-                # Remove sensitive fields from item
-                for key in list(redacted_item.keys()):
-                    key_lower = key.lower()
-                    # Remove if sensitive or not in allowed list
-                    if any(sensitive in key_lower for sensitive in SENSITIVE_KEYS):
-                        redacted_item[key] = "**REDACTED**"
-                    elif 'payload' in key_lower or 'data' in key_lower:
-                        # These often contain deliverables
+                # Remove sensitive fields from item; payload/data fields often
+                # contain deliverables too
+                for key in item:
+                    if _is_sensitive_item_key(key):
                         redacted_item[key] = "**REDACTED**"
                 
                 redacted_items.append(redacted_item)
@@ -114,8 +156,7 @@ def redact_order_payload(order_doc: Dict[str, Any], is_child_agent: bool = True)
         redacted['items'] = redacted_items
     
     # Add redaction notice
-    redacted['_redacted'] = True
-    redacted['_redaction_note'] = "Sensitive customer data redacted for agent viewing"
+    redacted.update(_REDACTION_MARKER)
     
     return redacted
 
@@ -129,11 +170,27 @@ def is_agent_context(context: Any) -> bool:
     Returns:
         True if this is a child agent bot, False if main bot
     """
+    # Cached on the context: it lives for one update and several checks
+    # (permission gates, download blocks) may ask the same question. Read it
+    # from the instance dict and accept only real bools, so a Mock's
+    # auto-created attribute is never mistaken for a cached verdict
     try:
-        agent_id = context.bot_data.get('agent_id')
-        return agent_id is not None
+        cached = vars(context).get('_is_agent_cached')
+    except TypeError:
+        cached = None  # No instance dict (e.g. __slots__)
+    if cached is True or cached is False:
+        return cached
+    
+    try:
+        result = context.bot_data.get('agent_id') is not None
     except (AttributeError, KeyError):
-        return False
+        result = False
+    
+    try:
+        context._is_agent_cached = result
+    except (AttributeError, TypeError):
+        pass  # Context doesn't accept attributes; just don't cache
+    return result
 
 
 def redact_order_list(orders: List[Dict[str, Any]], is_child_agent: bool = True) -> List[Dict[str, Any]]:
@@ -149,7 +206,8 @@ def redact_order_list(orders: List[Dict[str, Any]], is_child_agent: bool = True)
     if not is_child_agent:
         return orders
     
-    return [redact_order_payload(order, is_child_agent=True) for order in orders]
+    redact = redact_order_payload
+    return [redact(order) for order in orders]
 
 
 def get_permission_denied_message(lang: str = 'zh') -> str:
@@ -5,15 +5,53 @@ to prevent overselling across multiple concurrent bot instances.
 """
 
 import logging
+import threading
+import uuid
+from datetime import datetime
 from typing import List, Dict, Optional
 from models.constants import STATE_AVAILABLE, STATE_SOLD
 
+try:
+    from cachetools import TTLCache
+except ImportError:
+    TTLCache = None
+
+# Short-lived cache for get_available_stock, keyed by (collection, nowuid),
+# so product lists don't run one count per product on every render.
+# Disabled (every call counts in MongoDB) when cachetools is not installed.
+STOCK_COUNT_CACHE_TTL = 2
+_stock_count_cache = TTLCache(maxsize=1024, ttl=STOCK_COUNT_CACHE_TTL) if TTLCache else None
+_stock_count_cache_lock = threading.Lock()
+
+
+def invalidate_stock_count(nowuid: str = None) -> None:
+    """Drop cached available-stock counts.
+    
+    Args:
+        nowuid: Product to drop; clears the whole cache when None.
+    """
+    if _stock_count_cache is None:
+        return
+    with _stock_count_cache_lock:
+        if nowuid is None:
+            _stock_count_cache.clear()
+            return
+        for key in [k for k in _stock_count_cache if k[1] == nowuid]:
+            _stock_count_cache.pop(key, None)
+
+
+# Bounded retries when concurrent buyers take some of the selected items
+RESERVE_MAX_ROUNDS = 5
+
 
 def reserve_stock(hb_collection, nowuid: str, user_id: int, count: int) -> Optional[List[Dict]]:
     """Atomically reserve stock for an order.
     
-    This uses find_one_and_update in a loop to atomically reserve items
-    one at a time, preventing race conditions.
+    Candidate item ids are fetched in one query and claimed with a single
+    update_many conditioned on state=available, so concurrent buyers can
+    never claim the same item. Items lost to a concurrent buyer are topped
+    up in further rounds. Every claimed item is tagged with a per-call
+    reservation_id so a partial reservation can be found and rolled back.
     
     Args:
         hb_collection: MongoDB collection for inventory (hb).
@@ -24,38 +62,54 @@ def reserve_stock(hb_collection, nowuid: str, user_id: int, count: int) -> Optio
     Returns:
         List[Dict]: List of reserved items, or None if insufficient stock.
     """
-    reserved_items = []
+    if count <= 0:
+        # Nothing to reserve; limit(0) would otherwise mean "no limit"
+        return []
+    
+    reservation_id = uuid.uuid4().hex
+    reserved = 0
     
     try:
-        for _ in range(count):
-            # Atomically find and update one available item
-            item = hb_collection.find_one_and_update(
-                {
-                    'nowuid': nowuid,
-                    'state': STATE_AVAILABLE
-                },
+        reserved_at = datetime.now()
+        for _ in range(RESERVE_MAX_ROUNDS):
+            needed = count - reserved
+            ids = [
+                doc['_id'] for doc in hb_collection.find(
+                    {'nowuid': nowuid, 'state': STATE_AVAILABLE},
+                    {'_id': 1}
+                ).limit(needed)
+            ]
+            if len(ids) < needed:
+                break
+            
+            result = hb_collection.update_many(
+                {'_id': {'$in': ids}, 'state': STATE_AVAILABLE},
                 {
                     '$set': {
                         'state': STATE_SOLD,
                         'sold_to_user_id': user_id,
-                        'reserved_at': logging.time.strftime('%Y-%m-%d %H:%M:%S')
+                        'reserved_at': reserved_at,
+                        'reservation_id': reservation_id
                     }
-                },
-                return_document=True
+                }
             )
-            
-            if item is None:
-                # Not enough stock available
-                logging.warning(
-                    f"Insufficient stock for nowuid={nowuid}, "
-                    f"needed {count}, got {len(reserved_items)}"
-                )
-                # Rollback what we reserved
-                if reserved_items:
-                    rollback_stock(hb_collection, [i['_id'] for i in reserved_items])
-                return None
-            
-            reserved_items.append(item)
+            reserved += result.modified_count
+            if reserved >= count:
+                break
+        
+        if reserved < count:
+            # Not enough stock available
+            logging.warning(
+                f"Insufficient stock for nowuid={nowuid}, "
+                f"needed {count}, got {reserved}"
+            )
+            # Rollback what we reserved
+            if reserved:
+                _rollback_reservation(hb_collection, reservation_id)
+            return None
+        
+        reserved_items = list(hb_collection.find({'reservation_id': reservation_id}))
+        invalidate_stock_count(nowuid)
         
         logging.info(
             f"Reserved {count} items for user {user_id}, "
@@ -65,12 +119,26 @@ def reserve_stock(hb_collection, nowuid: str, user_id: int, count: int) -> Optio
         
     except Exception as e:
         logging.error(f"Error reserving stock: {e}")
-        # Rollback on error
-        if reserved_items:
-            rollback_stock(hb_collection, [i['_id'] for i in reserved_items])
+        # Rollback on error. Unconditional: an update_many may have claimed
+        # items before raising, without its count reaching `reserved`
+        _rollback_reservation(hb_collection, reservation_id)
         return None
 
 
+def _rollback_reservation(hb_collection, reservation_id: str) -> bool:
+    """Rollback every item claimed under a reservation_id."""
+    try:
+        item_ids = [
+            doc['_id'] for doc in hb_collection.find({'reservation_id': reservation_id}, {'_id': 1})
+        ]
+    except Exception as e:
+        logging.error(f"Error looking up reservation {reservation_id}: {e}")
+        return False
+    if not item_ids:
+        return True
+    return rollback_stock(hb_collection, item_ids)
+
+
 def rollback_stock(hb_collection, item_ids: List) -> bool:
     """Rollback reserved stock back to available.
     
@@ -88,7 +156,8 @@ def rollback_stock(hb_collection, item_ids: List) -> bool:
                 '$set': {'state': STATE_AVAILABLE},
                 '$unset': {
                     'sold_to_user_id': '',
-                    'reserved_at': ''
+                    'reserved_at': '',
+                    'reservation_id': ''
                 }
             }
         )
@@ -106,6 +175,9 @@ def rollback_stock(hb_collection, item_ids: List) -> bool:
 def get_available_stock(hb_collection, nowuid: str) -> int:
     """Get the count of available stock for a product.
     
+    Counts are cached for STOCK_COUNT_CACHE_TTL seconds; reserve_stock
+    drops the product's entry, other writers can call invalidate_stock_count.
+    
     Args:
         hb_collection: MongoDB collection for inventory (hb).
         nowuid: Product identifier.
@@ -113,11 +185,23 @@ def get_available_stock(hb_collection, nowuid: str) -> int:
     Returns:
         int: Count of available items.
     """
+    cache_key = (hb_collection.full_name, nowuid)
+    if _stock_count_cache is not None:
+        with _stock_count_cache_lock:
+            cached = _stock_count_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
     try:
-        return hb_collection.count_documents({
+        count = hb_collection.count_documents({
             'nowuid': nowuid,
             'state': STATE_AVAILABLE
         })
     except Exception as e:
         logging.error(f"Error getting available stock: {e}")
         return 0
+    
+    if _stock_count_cache is not None:
+        with _stock_count_cache_lock:
+            _stock_count_cache[cache_key] = count
+    return count
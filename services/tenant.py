@@ -3,9 +3,15 @@
 This module provides helpers for working with multi-tenant contexts.
 """
 
+import sys
+from functools import lru_cache
+
 from models.constants import TENANT_MASTER, TENANT_AGENT_PREFIX
 
+_PREFIX_LEN = len(TENANT_AGENT_PREFIX)
+
 
+@lru_cache(maxsize=1024)
 def get_tenant_string(agent_id: str = None) -> str:
     """Get the tenant string for a given agent.
     
@@ -17,9 +23,11 @@ def get_tenant_string(agent_id: str = None) -> str:
     """
     if agent_id is None:
         return TENANT_MASTER
-    return f"{TENANT_AGENT_PREFIX}{agent_id}"
+    # Interned so repeated tenants share one object and compare by identity
+    return sys.intern(f"{TENANT_AGENT_PREFIX}{agent_id}")
 
 
+@lru_cache(maxsize=1024)
 def parse_agent_id(tenant: str) -> str:
     """Extract agent ID from a tenant string.
     
@@ -32,7 +40,7 @@ def parse_agent_id(tenant: str) -> str:
     if tenant == TENANT_MASTER:
         return None
     if tenant.startswith(TENANT_AGENT_PREFIX):
-        return tenant[len(TENANT_AGENT_PREFIX):]
+        return tenant[_PREFIX_LEN:]
     return None
 
 
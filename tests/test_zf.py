@@ -0,0 +1,126 @@
+"""Tests for the zf.py block filter.
+
+zf.py imports tronpy and pika at module level, so these tests are skipped
+where either is not installed.
+"""
+
+import copy
+
+import pytest
+
+pytest.importorskip("tronpy")
+pytest.importorskip("pika")
+
+import zf  # noqa: E402
+
+
+# A USDT transfer as returned by getblockbynum with visible=true, which is
+# what tronpy's Tron.get_block requests: every address is Base58
+VISIBLE_USDT_TRANSFER = {
+    "ret": [{"contractRet": "SUCCESS"}],
+    "signature": [
+        "3e7a4a0e2d8a1f0c5b6c9d8e7f6a5b4c3d2e1f0a9b8c7d6e5f4a3b2c1d0e9f8a"
+        "7b6c5d4e3f2a1b0c9d8e7f6a5b4c3d2e1f0a9b8c7d6e5f4a3b2c1d0e9f8a7b6c1c"
+    ],
+    "txID": "8a5d4f1c2b3e6a7d9c0b1e2f3a4d5c6b7e8f9a0b1c2d3e4f5a6b7c8d9e0f1a2b",
+    "raw_data": {
+        "contract": [{
+            "parameter": {
+                "value": {
+                    "data": (
+                        "a9059cbb"
+                        "0000000000000000000000004b0b2ec4e5ac0c2c1e1f6d6e3f5e6c3a5b1d2c3e"
+                        "0000000000000000000000000000000000000000000000000000000005f5e100"
+                    ),
+                    "owner_address": "TNaRAoLUyYEV2uF7GUrzSjRQTU8v5ZJ5VR",
+                    "contract_address": "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t",
+                },
+                "type_url": "type.googleapis.com/protocol.TriggerSmartContract",
+            },
+            "type": "TriggerSmartContract",
+        }],
+        "ref_block_bytes": "6a1f",
+        "ref_block_hash": "5e0c8a7f3b2d1c4e",
+        "expiration": 1700000060000,
+        "fee_limit": 100000000,
+        "timestamp": 1700000001000,
+    },
+    "raw_data_hex": "0a026a1f22085e0c8a7f3b2d1c4e40e0a6c6f2b7315aae01",
+}
+
+VISIBLE_TRX_TRANSFER = {
+    "ret": [{"contractRet": "SUCCESS"}],
+    "txID": "1f2e3d4c5b6a79880f1e2d3c4b5a69788f9e0d1c2b3a49586f7e8d9c0b1a2938",
+    "raw_data": {
+        "contract": [{
+            "parameter": {
+                "value": {
+                    "amount": 1000000,
+                    "owner_address": "TNaRAoLUyYEV2uF7GUrzSjRQTU8v5ZJ5VR",
+                    "to_address": "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t",
+                },
+                "type_url": "type.googleapis.com/protocol.TransferContract",
+            },
+            "type": "TransferContract",
+        }],
+        "timestamp": 1700000002000,
+    },
+}
+
+
+def test_visible_usdt_transfer_is_kept():
+    assert zf.is_usdt_call(VISIBLE_USDT_TRANSFER)
+
+
+def test_hex_usdt_transfer_is_kept():
+    trx = copy.deepcopy(VISIBLE_USDT_TRANSFER)
+    value = trx["raw_data"]["contract"][0]["parameter"]["value"]
+    value["contract_address"] = "41a614f803b6fd780986a42c78ec9c7f77e6ded13c"
+    assert zf.is_usdt_call(trx)
+
+
+def test_other_contracts_are_dropped():
+    assert not zf.is_usdt_call(VISIBLE_TRX_TRANSFER)
+
+    trx = copy.deepcopy(VISIBLE_USDT_TRANSFER)
+    value = trx["raw_data"]["contract"][0]["parameter"]["value"]
+    value["contract_address"] = "TEkxiTehnzSmSe2XqrBj4w32RUN966rdz8"
+    assert not zf.is_usdt_call(trx)
+
+
+def test_publish_block_keeps_visible_usdt_transfer(monkeypatch):
+    published = []
+    monkeypatch.setattr(zf.publisher, "add", lambda data, block: published.append((data, block)))
+
+    block_data = {
+        "blockID": "0000000003b9aca0",
+        "block_header": {"raw_data": {"number": 62500000}},
+        "transactions": [VISIBLE_TRX_TRANSFER, VISIBLE_USDT_TRANSFER],
+    }
+    zf.publish_block(block_data, 62500000)
+
+    assert len(published) == 1
+    data, block = published[0]
+    assert block == 62500000
+    assert data["transactions"] == [VISIBLE_USDT_TRANSFER]
+
+
+def test_flush_keeps_batch_until_published(monkeypatch):
+    publisher = zf.Publisher()
+    results = iter([False, True])
+    bodies = []
+
+    def publish(body):
+        bodies.append(body)
+        return next(results)
+
+    monkeypatch.setattr(publisher, "publish", publish)
+    publisher.add({"n": 1}, 1)
+    publisher.add({"n": 2}, 2)
+
+    assert not publisher.flush()
+    assert publisher._pending_blocks == [1, 2]
+
+    assert publisher.flush()
+    assert publisher._pending_blocks == []
+    assert bodies[0] == bodies[1]
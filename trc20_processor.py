@@ -9,11 +9,18 @@ This module handles:
 
 import os
 import logging
-from decimal import Decimal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, ROUND_CEILING, ROUND_FLOOR
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
+
+from bson.decimal128 import Decimal128
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from mongo import topup, user, qukuai, claim_qukuai_tx, release_qukuai_tx, QUKUAI_STATE_DONE
 
-from mongo import topup, user, qukuai
 from tron_helpers import (
     normalize_address_to_base58,
     amount_from_sun,
@@ -22,11 +29,61 @@ from tron_helpers import (
     get_trc20_transfers_by_address,
     validate_trc20_transfer,
     format_usdt_amount,
+    AMOUNT_TOLERANCE,
+    USDT_UNIT,
     TRON_MIN_CONFIRMATIONS,
     USDT_CONTRACT
 )
 
 
+# Max candidate orders fetched for one transfer amount
+AMOUNT_MATCH_CANDIDATES = 5
+
+# Max qukuai transfers fetched when rescanning one order, and the time
+# window (either side of the order time) they are searched in
+RESCAN_TX_CANDIDATES = 10
+RESCAN_WINDOW_MS = 2 * 60 * 60 * 1000
+
+# Server-side money range half-width: the match tolerance, doubled to absorb
+# float rounding of the stored amount
+_MONEY_RANGE_PAD = float(AMOUNT_TOLERANCE) * 2
+
+# Attempts at writing qukuai "processed" marks for credited transfers
+QUKUAI_MARK_RETRIES = 3
+
+
+# Only the fields matching/crediting reads; skips QR paths, pay URLs, notes
+_ORDER_PROJECTION = {
+    '_id': 1, 'bianhao': 1, 'money': 1, 'usdt': 1, 'user_id': 1,
+    'expire_time': 1, 'time': 1, 'status': 1
+}
+_TX_PROJECTION = {
+    '_id': 1, 'txid': 1, 'to_address': 1, 'quant': 1, 'number': 1,
+    'type': 1, 'time': 1
+}
+
+
+def _to_decimal(value) -> Decimal:
+    """Convert a stored amount to Decimal without a str() round-trip where possible.
+    
+    Decimal128 and Decimal are used as-is and ints convert exactly; floats go
+    through repr so 10.1 stays 10.1 rather than its binary expansion.
+    """
+    value_type = type(value)
+    if value_type is Decimal:
+        return value
+    if value_type is Decimal128:
+        return value.to_decimal()
+    if value_type is int:
+        return Decimal(value)
+    return Decimal(repr(value)) if value_type is float else Decimal(str(value))
+
+
+def _micro_key(amount: Decimal) -> int:
+    """Amount in micro-USDT, rounded to an int, for amount-indexed lookups."""
+    return int((amount * USDT_UNIT).to_integral_value())
+
+
 class TRC20PaymentProcessor:
     """Processor for TRC20 USDT payments."""
     
@@ -58,7 +115,7 @@ class TRC20PaymentProcessor:
                 'cz_type': 'usdt',
                 # Note: address field might be stored in various ways
                 # We'll need to check the actual schema
-            }))
+            }, _ORDER_PROJECTION))
             
             return orders
             
@@ -90,26 +147,48 @@ class TRC20PaymentProcessor:
             time_start = payment_time - timedelta(minutes=time_window_minutes)
             time_end = payment_time + timedelta(minutes=time_window_minutes)
             
-            # Find orders with matching amount in time window
+            # Find orders with matching amount in time window; the amount
+            # range is applied server-side (money is stored as a float, so the
+            # range is padded and the exact Decimal check runs below)
+            amount_f = float(amount)
             orders = list(topup.find({
                 'status': 'pending',
                 'cz_type': 'usdt',
                 'time': {
                     '$gte': time_start,
                     '$lte': time_end
+                },
+                'money': {
+                    '$gte': amount_f - _MONEY_RANGE_PAD,
+                    '$lte': amount_f + _MONEY_RANGE_PAD
                 }
-            }))
+            }, _ORDER_PROJECTION).limit(AMOUNT_MATCH_CANDIDATES))
             
-            # Match by amount (within tolerance)
+            # Index candidates by amount in micro-USDT (the tolerance unit), then
+            # probe the transfer's own key and its neighbours: every order
+            # within AMOUNT_TOLERANCE rounds to one of those three keys
+            by_micro = {}
             for order in orders:
-                order_amount = Decimal(str(order.get('money', 0)))
+                order_amount = _to_decimal(order.get('money', 0))
+                by_micro.setdefault(_micro_key(order_amount), (order_amount, order))
+            
+            key = _micro_key(amount)
+            best = None
+            best_diff = None
+            for probe in (key, key - 1, key + 1):
+                hit = by_micro.get(probe)
+                if hit is None:
+                    continue
+                order_amount, order = hit
                 if amounts_match(amount, order_amount):
-                    return order
+                    diff = abs(order_amount - amount)
+                    if best is None or diff < best_diff:
+                        best, best_diff = order, diff
             
-            return None
+            return best
             
         except Exception as e:
-            logging.error(f"Error finding order by amount and time: {e}")
+            logging.error("Error finding order by amount and time: %s", e)
             return None
     
     def is_already_credited(self, txid: str) -> bool:
@@ -125,8 +204,8 @@ class TRC20PaymentProcessor:
             # Check if TXID exists in credited orders
             credited = topup.find_one({
                 'txid': txid,
-                'status': 'completed'
-            })
+                'status': 'success'
+            }, {'_id': 1})
             return credited is not None
         except Exception as e:
             logging.error(f"Error checking if credited {txid}: {e}")
@@ -135,36 +214,56 @@ class TRC20PaymentProcessor:
     def credit_order(self, order: Dict, txid: str, transfer_amount: Decimal) -> bool:
         """Credit a topup order and update user balance.
         
+        The order is claimed with a conditional update (still pending, no
+        TXID yet), so concurrent workers can credit it at most once; the
+        balance is only incremented by the worker whose update matched.
+        
         Args:
             order: Order document from topup collection
             txid: Transaction ID for idempotency
             transfer_amount: Actual transfer amount received
         
         Returns:
-            True if credited successfully
+            True if credited successfully (or already credited with this TXID)
         """
+        bianhao = order.get('bianhao')
         try:
-            # Check if already credited
-            if self.is_already_credited(txid):
-                logging.info(f"Order {order.get('bianhao')} already credited with TXID {txid}")
-                return True
-            
+            order_id = order['_id']
             user_id = order.get('user_id')
-            order_amount = Decimal(str(order.get('money', 0)))
-            usdt_amount = Decimal(str(order.get('usdt', 0)))
-            
-            # Update order status and add TXID
-            topup.update_one(
-                {'_id': order['_id']},
-                {
-                    '$set': {
-                        'status': 'completed',
-                        'txid': txid,
-                        'credited_at': datetime.now(),
-                        'credited_amount': str(transfer_amount)
+            usdt_amount = _to_decimal(order.get('usdt', 0))
+            
+            # Update order status and add TXID, only if nobody has yet.
+            # 'success' and success_time match what bot.py jiexi writes, so
+            # recharge history and income stats see these orders too
+            now = datetime.now()
+            try:
+                result = topup.update_one(
+                    {
+                        '_id': order_id,
+                        'status': 'pending',
+                        'txid': {'$exists': False}
+                    },
+                    {
+                        '$set': {
+                            'status': 'success',
+                            'txid': txid,
+                            'success_time': now,
+                            'credited_at': now,
+                            'credited_amount': str(transfer_amount)
+                        }
                     }
-                }
-            )
+                )
+            except DuplicateKeyError:
+                # Unique txid index: this TXID already credited another order
+                logging.info("TXID %s already credited to another order", txid)
+                return True
+            
+            if result.modified_count == 0:
+                if self.is_already_credited(txid):
+                    logging.info("Order %s already credited with TXID %s", bianhao, txid)
+                    return True
+                logging.warning("Order %s is no longer pending, not crediting TXID %s", bianhao, txid)
+                return False
             
             # Update user balance
             user.update_one(
@@ -173,9 +272,8 @@ class TRC20PaymentProcessor:
             )
             
             logging.info(
-                f"✅ Credited order {order.get('bianhao')}: "
-                f"user={user_id}, amount={format_usdt_amount(usdt_amount)} USDT, "
-                f"txid={txid}"
+                "✅ Credited order %s: user=%s, amount=%s USDT, txid=%s",
+                bianhao, user_id, usdt_amount, txid
             )
             
             # TODO: Send notification to user
@@ -185,83 +283,149 @@ class TRC20PaymentProcessor:
             return True
             
         except Exception as e:
-            logging.error(f"❌ Failed to credit order {order.get('bianhao')}: {e}")
+            logging.error("❌ Failed to credit order %s: %s", bianhao, e)
             return False
     
-    def process_transaction_from_qukuai(self, tx_doc: Dict) -> bool:
+    def process_transaction_from_qukuai(self, tx_doc: Dict, processed_ops: Optional[List] = None) -> bool:
         """Process a transaction from qukuai collection.
         
         Args:
             tx_doc: Transaction document from qukuai collection
+            processed_ops: If given, the "processed" flag update for qukuai is
+                appended here (as an UpdateOne) instead of being written
+                immediately, so a batch can commit them in one bulk_write
         
         Returns:
             True if processed (credited or skipped with reason)
         """
         try:
+            # Skip if not USDT, before any other field access or formatting
+            if tx_doc.get('type') != 'USDT':
+                logging.debug("Skipping non-USDT transaction %s", tx_doc.get('txid'))
+                return False
+            
             txid = tx_doc.get('txid')
             to_address = tx_doc.get('to_address')
             value_sun = tx_doc.get('quant', 0)
-            block_number = tx_doc.get('number')
-            tx_type = tx_doc.get('type')
-            
-            # Skip if not USDT
-            if tx_type != 'USDT':
-                logging.debug(f"Skipping non-USDT transaction {txid}")
-                return False
             
             # Convert amount
             transfer_amount = amount_from_sun(value_sun)
             
             logging.info(
-                f"Processing transaction: txid={txid}, "
-                f"to={to_address}, amount={format_usdt_amount(transfer_amount)}"
+                "Processing transaction: txid=%s, to=%s, amount=%s",
+                txid, to_address, transfer_amount
             )
             
             # Check if already credited
             if self.is_already_credited(txid):
-                logging.debug(f"Transaction {txid} already credited")
+                logging.debug("Transaction %s already credited", txid)
                 return True
             
             # Check confirmations
             confirmations = get_transaction_confirmations(txid)
             if confirmations is None:
-                logging.warning(f"Failed to get confirmations for {txid}")
+                logging.warning("Failed to get confirmations for %s", txid)
                 return False
             
             if confirmations < self.min_confirmations:
                 logging.info(
-                    f"Insufficient confirmations for {txid}: "
-                    f"{confirmations}/{self.min_confirmations}"
+                    "Insufficient confirmations for %s: %s/%s",
+                    txid, confirmations, self.min_confirmations
                 )
                 return False
             
             # Try to find matching order by amount and time
-            timestamp_ms = tx_doc.get('time', int(datetime.now().timestamp() * 1000))
+            timestamp_ms = tx_doc.get('time')
+            if timestamp_ms is None:
+                timestamp_ms = int(datetime.now().timestamp() * 1000)
             order = self.find_order_by_amount_and_time(transfer_amount, timestamp_ms)
             
             if not order:
                 logging.warning(
-                    f"No matching order found for txid={txid}, "
-                    f"amount={format_usdt_amount(transfer_amount)}"
+                    "No matching order found for txid=%s, amount=%s",
+                    txid, transfer_amount
                 )
                 return False
             
+            # Claim the qukuai document so bot.py jiexi cannot credit the same
+            # transfer at the same time; only the claim winner credits it
+            if not claim_qukuai_tx(tx_doc['_id']):
+                logging.info("Transaction %s is already being handled elsewhere", txid)
+                return False
+            
             # Credit the order
             success = self.credit_order(order, txid, transfer_amount)
             
             if success:
                 # Mark transaction as processed in qukuai
-                qukuai.update_one(
+                mark = UpdateOne(
                     {'_id': tx_doc['_id']},
-                    {'$set': {'state': 1, 'processed_at': datetime.now()}}
+                    {'$set': {'state': QUKUAI_STATE_DONE, 'processed_at': datetime.now()}}
                 )
+                if processed_ops is not None:
+                    processed_ops.append(mark)
+                else:
+                    self._commit_processed([mark])
+            else:
+                release_qukuai_tx(tx_doc['_id'])
             
             return success
             
         except Exception as e:
-            logging.error(f"Error processing transaction from qukuai: {e}")
+            logging.error("Error processing transaction from qukuai: %s", e)
             return False
     
+    def process_transactions_from_qukuai(self, tx_docs: List[Dict]) -> int:
+        """Process a batch of qukuai transactions (e.g. one block's worth).
+        
+        Each transaction is matched and credited as in
+        process_transaction_from_qukuai; the qukuai "processed" flags are
+        then committed with a single unordered bulk_write.
+        
+        Args:
+            tx_docs: Transaction documents from qukuai collection
+        
+        Returns:
+            Number of transactions credited
+        """
+        processed_ops = []
+        credited = 0
+        for tx_doc in tx_docs:
+            if self.process_transaction_from_qukuai(tx_doc, processed_ops):
+                credited += 1
+        
+        if processed_ops:
+            self._commit_processed(processed_ops)
+        
+        return credited
+    
+    def _commit_processed(self, ops: List[UpdateOne]) -> None:
+        """Write qukuai "processed" marks, retrying before giving up.
+        
+        The orders behind these marks are already credited, so a lost mark
+        leaves the transfer CLAIMED until the claim times out. jiexi then
+        skips it on its txid check, but the failure is raised so the caller
+        sees it rather than only a log line.
+        
+        Args:
+            ops: UpdateOne operations setting state DONE
+        
+        Raises:
+            PyMongoError: If the marks still cannot be written after retrying
+        """
+        for attempt in range(1, QUKUAI_MARK_RETRIES + 1):
+            try:
+                qukuai.bulk_write(ops, ordered=False)
+                return
+            except PyMongoError as e:
+                logging.error(
+                    "Error marking %d qukuai transactions processed (attempt %d/%d): %s",
+                    len(ops), attempt, QUKUAI_MARK_RETRIES, e
+                )
+                if attempt == QUKUAI_MARK_RETRIES:
+                    raise
+                time.sleep(attempt)
+    
     def scan_pending_orders(self) -> Dict:
         """Scan all pending orders and try to match with blockchain transfers.
         
@@ -277,43 +441,35 @@ class TRC20PaymentProcessor:
         }
         
         try:
-            # Find all pending USDT orders
-            orders = list(topup.find({
+            # Expire overdue orders in one server-side update. expire_time is
+            # stored as '%Y-%m-%d %H:%M:%S', which sorts the same as the time
+            # it encodes, so a string comparison is enough
+            now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            result = topup.update_many(
+                {
+                    'status': 'pending',
+                    'cz_type': 'usdt',
+                    'expire_time': {'$lt': now_str}
+                },
+                {'$set': {'status': 'expired'}}
+            )
+            summary['expired'] = result.modified_count
+            
+            # Count remaining pending USDT orders server-side; nothing is
+            # done per order yet, so there is no need to pull the documents
+            # TODO: Get payment address for each order
+            # The current schema doesn't seem to store the payment address
+            # We would need to either:
+            # 1. Add address field to order when created
+            # 2. Match by amount and time window
+            # For now, we rely on matching by amount and time
+            # which is done when processing qukuai transactions
+            summary['pending'] = topup.count_documents({
                 'status': 'pending',
                 'cz_type': 'usdt'
-            }))
+            })
             
-            summary['total'] = len(orders)
-            
-            for order in orders:
-                try:
-                    # Check if expired
-                    expire_time = order.get('expire_time')
-                    if expire_time:
-                        expire_dt = datetime.strptime(expire_time, '%Y-%m-%d %H:%M:%S')
-                        if datetime.now() > expire_dt:
-                            summary['expired'] += 1
-                            # Mark as expired
-                            topup.update_one(
-                                {'_id': order['_id']},
-                                {'$set': {'status': 'expired'}}
-                            )
-                            continue
-                    
-                    # TODO: Get payment address for this order
-                    # The current schema doesn't seem to store the payment address
-                    # We would need to either:
-                    # 1. Add address field to order when created
-                    # 2. Match by amount and time window
-                    
-                    # For now, we rely on matching by amount and time
-                    # which is done when processing qukuai transactions
-                    
-                    summary['pending'] += 1
-                    
-                except Exception as e:
-                    logging.error(f"Error processing order {order.get('bianhao')}: {e}")
-                    summary['failed'] += 1
+            summary['total'] = summary['expired'] + summary['pending']
             
             return summary
             
@@ -336,7 +492,7 @@ class TRC20PaymentProcessor:
                 return True, f"Transaction {txid} already credited"
             
             # Look for transaction in qukuai
-            tx_doc = qukuai.find_one({'txid': txid})
+            tx_doc = qukuai.find_one({'txid': txid}, _TX_PROJECTION)
             if not tx_doc:
                 return False, f"Transaction {txid} not found in database"
             
@@ -352,6 +508,69 @@ class TRC20PaymentProcessor:
             logging.error(f"Error rescanning txid {txid}: {e}")
             return False, f"Error: {str(e)}"
     
+    def rescan_by_txids(self, txids: List[str], max_workers: int = 8) -> Dict[str, Tuple[bool, str]]:
+        """Rescan many transactions at once.
+        
+        Already-credited TXIDs and the qukuai documents are each fetched with
+        one $in query, confirmations for the rest are fetched concurrently
+        (they are independent Tron RPCs), and the qukuai "processed" flags
+        are committed in one bulk_write.
+        
+        Args:
+            txids: Transaction IDs to rescan
+            max_workers: Maximum concurrent confirmation lookups
+        
+        Returns:
+            Dict of txid -> (success, message), as rescan_by_txid returns
+        """
+        txids = list(dict.fromkeys(txids))
+        results = {}
+        if not txids:
+            return results
+        
+        try:
+            credited = {
+                doc['txid'] for doc in topup.find(
+                    {'txid': {'$in': txids}, 'status': 'success'},
+                    {'_id': 0, 'txid': 1}
+                )
+            }
+            for txid in credited:
+                results[txid] = (True, f"Transaction {txid} already credited")
+            
+            remaining = [txid for txid in txids if txid not in credited]
+            tx_docs = {
+                doc['txid']: doc
+                for doc in qukuai.find({'txid': {'$in': remaining}}, _TX_PROJECTION)
+            } if remaining else {}
+            
+            # Warm tron_helpers' tx block cache concurrently
+            to_check = [txid for txid in remaining if txid in tx_docs]
+            if to_check and max_workers > 1:
+                workers = min(max_workers, len(to_check))
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(get_transaction_confirmations, to_check))
+            
+            processed_ops = []
+            for txid in remaining:
+                tx_doc = tx_docs.get(txid)
+                if not tx_doc:
+                    results[txid] = (False, f"Transaction {txid} not found in database")
+                elif self.process_transaction_from_qukuai(tx_doc, processed_ops):
+                    results[txid] = (True, f"Successfully credited transaction {txid}")
+                else:
+                    results[txid] = (False, f"Failed to credit transaction {txid}")
+            
+            if processed_ops:
+                self._commit_processed(processed_ops)
+            
+        except Exception as e:
+            logging.error(f"Error rescanning {len(txids)} txids: {e}")
+            for txid in txids:
+                results.setdefault(txid, (False, f"Error: {str(e)}"))
+        
+        return results
+    
     def rescan_by_order(self, order_id: str) -> Tuple[bool, str]:
         """Rescan and try to find payment for a specific order.
         
@@ -363,15 +582,15 @@ class TRC20PaymentProcessor:
         """
         try:
             # Find the order
-            order = topup.find_one({'bianhao': order_id})
+            order = topup.find_one({'bianhao': order_id}, _ORDER_PROJECTION)
             if not order:
                 return False, f"Order {order_id} not found"
             
             # Check if already completed
-            if order.get('status') == 'completed':
+            if order.get('status') == 'success':
                 return True, f"Order {order_id} already completed"
             
-            order_amount = Decimal(str(order.get('money', 0)))
+            order_amount = _to_decimal(order.get('money', 0))
             order_time = order.get('time')
             
             if not order_time:
@@ -379,27 +598,28 @@ class TRC20PaymentProcessor:
             
             # Search for matching transactions in a wide time window (±2 hours)
             timestamp_ms = int(order_time.timestamp() * 1000)
+            time_start_ms = timestamp_ms - RESCAN_WINDOW_MS
+            time_end_ms = timestamp_ms + RESCAN_WINDOW_MS
             
-            # Look in qukuai for matching transactions
-            time_start = order_time - timedelta(hours=2)
-            time_end = order_time + timedelta(hours=2)
+            # Amount window in sun (quant is stored as an integer)
+            sun_lo = int(((order_amount - AMOUNT_TOLERANCE) * USDT_UNIT).to_integral_value(ROUND_CEILING))
+            sun_hi = int(((order_amount + AMOUNT_TOLERANCE) * USDT_UNIT).to_integral_value(ROUND_FLOOR))
             
             transactions = list(qukuai.find({
                 'type': 'USDT',
                 'time': {
-                    '$gte': int(time_start.timestamp() * 1000),
-                    '$lte': int(time_end.timestamp() * 1000)
-                }
-            }))
+                    '$gte': time_start_ms,
+                    '$lte': time_end_ms
+                },
+                'quant': {'$gte': sun_lo, '$lte': sun_hi}
+            }, _TX_PROJECTION).limit(RESCAN_TX_CANDIDATES))
             
-            # Try to match by amount
+            # The sun window already enforces amounts_match exactly
             for tx_doc in transactions:
-                tx_amount = amount_from_sun(tx_doc.get('quant', 0))
-                if amounts_match(tx_amount, order_amount):
-                    # Found a match, try to credit
-                    success = self.process_transaction_from_qukuai(tx_doc)
-                    if success:
-                        return True, f"Successfully matched and credited order {order_id}"
+                # Found a match, try to credit
+                success = self.process_transaction_from_qukuai(tx_doc)
+                if success:
+                    return True, f"Successfully matched and credited order {order_id}"
             
             return False, f"No matching payment found for order {order_id}"
             
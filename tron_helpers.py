@@ -10,12 +10,17 @@ This module provides utilities for:
 
 import os
 import logging
+import threading
 import time
-from decimal import Decimal, InvalidOperation
-from typing import Optional, Dict, List, Tuple
+from types import MappingProxyType
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Optional, Dict, List, NamedTuple, Tuple
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from tronpy import Tron
 from tronpy.providers import HTTPProvider
 from tronpy.exceptions import TronError, BadAddress
@@ -31,18 +36,77 @@ USDT_UNIT = Decimal(10 ** USDT_DECIMALS)
 
 # Amount tolerance for matching (1e-6 = 0.000001 USDT)
 AMOUNT_TOLERANCE = Decimal('0.000001')
+AMOUNT_TOLERANCE_SUN = 1
 
 
+TRONGRID_BASE_URL = "https://api.trongrid.io"
+TRONGRID_MAX_RETRIES = 3
+# Upper bound on fingerprint pages followed per query (200 events per page)
+TRONGRID_MAX_PAGES = 50
+
+_TRC20_ENDPOINT_TEMPLATE = TRONGRID_BASE_URL + "/v1/accounts/{}/transactions/trc20"
+# Query parameters shared by every TRC20 transfer request
+_TRC20_BASE_PARAMS = MappingProxyType({
+    'contract_address': USDT_CONTRACT,
+    'limit': 200,
+})
+
+
+class Trc20Transfer(NamedTuple):
+    """A parsed TRC20 transfer event."""
+    txid: str
+    from_address: str
+    to_address: str
+    value_sun: int
+    block_timestamp: int
+    contract_address: str
+
+
+def _build_trongrid_session() -> requests.Session:
+    """Create the pooled TronGrid session (API key header, retries with backoff)."""
+    session = requests.Session()
+    retry = Retry(
+        total=TRONGRID_MAX_RETRIES,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry))
+    if TRONGRID_API_KEY:
+        session.headers['TRON-PRO-API-KEY'] = TRONGRID_API_KEY
+    return session
+
+
+# Shared across calls so TronGrid requests reuse keep-alive connections
+_TRONGRID_SESSION = _build_trongrid_session()
+
+
+@lru_cache(maxsize=1)
 def get_tron_client():
-    """Get TRON client with API key if configured."""
+    """Get the shared TRON client (API key if configured).
+    
+    Built once and reused so every call shares one HTTP session and its
+    keep-alive connections instead of opening a new one.
+    """
     if TRONGRID_API_KEY:
         return Tron(HTTPProvider(api_key=TRONGRID_API_KEY))
     return Tron()
 
 
+def _is_base58_tron_addr(address) -> bool:
+    """Cheap shape check for an already-Base58 TRON address (T..., 34 chars)."""
+    return isinstance(address, str) and len(address) == 34 and address[0] == 'T'
+
+
+@lru_cache(maxsize=8192)
 def normalize_address_to_base58(address: str) -> Optional[str]:
     """Normalize address to Base58 format (T...).
     
+    Results are memoized: the conversion is deterministic and the same
+    wallets recur constantly while scanning.
+    
     Args:
         address: Address in Base58 (T...) or hex (41...) format
     
@@ -84,7 +148,8 @@ def amount_from_sun(sun_amount: int) -> Decimal:
         Decimal amount in USDT
     """
     try:
-        return Decimal(sun_amount) / USDT_UNIT
+        # Fixed power-of-ten scale: shift the exponent instead of dividing
+        return Decimal(sun_amount).scaleb(-USDT_DECIMALS)
     except (InvalidOperation, Exception) as e:
         logging.error(f"Failed to convert sun amount {sun_amount}: {e}")
         return Decimal('0')
@@ -109,11 +174,85 @@ def amounts_match(amount1: Decimal, amount2: Decimal, tolerance: Decimal = AMOUN
         return False
 
 
-def get_transaction_confirmations(txid: str) -> Optional[int]:
+def amount_to_sun(amount: Decimal) -> int:
+    """Convert a USDT amount to sun, rounding to the nearest unit.
+    
+    Args:
+        amount: Amount in USDT
+    
+    Returns:
+        Integer amount in sun
+    """
+    return int((Decimal(amount) * USDT_UNIT).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def amounts_match_sun(a_sun: int, b_sun: int, tol_sun: int = AMOUNT_TOLERANCE_SUN) -> bool:
+    """Integer counterpart of amounts_match for amounts already in sun.
+    
+    Args:
+        a_sun: First amount in sun
+        b_sun: Second amount in sun
+        tol_sun: Maximum allowed difference in sun
+    
+    Returns:
+        True if amounts match within tolerance
+    """
+    return abs(a_sun - b_sun) <= tol_sun
+
+
+# Latest block number is reused for this long (Tron produces a block every ~3s)
+LATEST_BLOCK_TTL = 2.0
+_latest_block = (0.0, None)  # (monotonic time fetched, block number)
+_latest_block_lock = threading.Lock()
+
+# Block number per confirmed txid; immutable once set, so kept until evicted
+TX_BLOCK_CACHE_SIZE = 4096
+_tx_block_cache = {}
+_tx_block_cache_lock = threading.Lock()
+
+
+def _get_latest_block_number(client) -> int:
+    """Latest block number, cached for LATEST_BLOCK_TTL seconds."""
+    global _latest_block
+    fetched_at, number = _latest_block
+    if number is not None and time.monotonic() - fetched_at < LATEST_BLOCK_TTL:
+        return number
+    number = client.get_latest_block_number()
+    with _latest_block_lock:
+        _latest_block = (time.monotonic(), number)
+    return number
+
+
+def _get_tx_block_number(client, txid: str) -> Optional[int]:
+    """Block number a transaction was included in, or None if not yet."""
+    with _tx_block_cache_lock:
+        cached = _tx_block_cache.get(txid)
+    if cached is not None:
+        return cached
+    
+    tx_info = client.get_transaction_info(txid)
+    if not tx_info or 'blockNumber' not in tx_info:
+        return None
+    
+    tx_block = tx_info['blockNumber']
+    with _tx_block_cache_lock:
+        if len(_tx_block_cache) >= TX_BLOCK_CACHE_SIZE:
+            # Drop the oldest entry (dicts keep insertion order)
+            _tx_block_cache.pop(next(iter(_tx_block_cache)))
+        _tx_block_cache[txid] = tx_block
+    return tx_block
+
+
+def get_transaction_confirmations(txid: str, latest_block: Optional[int] = None) -> Optional[int]:
     """Get number of confirmations for a transaction.
     
+    A transaction's block number is cached once known and the latest block
+    number is shared for LATEST_BLOCK_TTL seconds, so checking M transfers
+    costs about M + 1 RPCs instead of 2M.
+    
     Args:
         txid: Transaction ID
+        latest_block: Latest block number, if the caller already has it
     
     Returns:
         Number of confirmations or None if not found/error
@@ -122,15 +261,14 @@ def get_transaction_confirmations(txid: str) -> Optional[int]:
         client = get_tron_client()
         
         # Get transaction info
-        tx_info = client.get_transaction_info(txid)
-        if not tx_info or 'blockNumber' not in tx_info:
+        tx_block = _get_tx_block_number(client, txid)
+        if tx_block is None:
             logging.warning(f"Transaction {txid} not found or not confirmed")
             return 0
         
-        tx_block = tx_info['blockNumber']
-        
         # Get latest block
-        latest_block = client.get_latest_block_number()
+        if latest_block is None:
+            latest_block = _get_latest_block_number(client)
         
         confirmations = latest_block - tx_block + 1
         return confirmations
@@ -149,7 +287,7 @@ def get_trc20_transfers_by_address(
     end_timestamp: int,
     only_to: bool = True,
     max_retries: int = 3
-) -> List[Dict]:
+) -> List[Trc20Transfer]:
     """Get TRC20 USDT transfers for an address using TronGrid API.
     
     Args:
@@ -157,10 +295,15 @@ def get_trc20_transfers_by_address(
         start_timestamp: Start time in milliseconds
         end_timestamp: End time in milliseconds
         only_to: If True, only get transfers where address is recipient
-        max_retries: Maximum number of retries on failure
+        max_retries: Maximum number of attempts per page when still rate
+            limited after the session's own retries
+    
+    Pages are followed through the ``meta.fingerprint`` cursor until the
+    window is exhausted (capped at TRONGRID_MAX_PAGES).
     
     Returns:
-        List of transfer events
+        List of Trc20Transfer events. Amounts are kept as integer ``value_sun``;
+        use amount_from_sun() when a USDT Decimal is needed for display.
     """
     transfers = []
     
@@ -170,66 +313,69 @@ def get_trc20_transfers_by_address(
         logging.error(f"Invalid address format")
         return transfers
     
-    # TronGrid API endpoint
-    base_url = "https://api.trongrid.io"
-    if TRONGRID_API_KEY:
-        base_url = f"{base_url}?TRON-PRO-API-KEY={TRONGRID_API_KEY}"
-    
-    endpoint = f"{base_url}/v1/accounts/{address}/transactions/trc20"
+    endpoint = _TRC20_ENDPOINT_TEMPLATE.format(address)
     
     params = {
-        'contract_address': USDT_CONTRACT,
+        **_TRC20_BASE_PARAMS,
         'only_to': 'true' if only_to else 'false',
         'min_timestamp': start_timestamp,
         'max_timestamp': end_timestamp,
-        'limit': 200
     }
     
-    for attempt in range(max_retries):
+    # Connection errors, 5xx and 429 (honouring Retry-After) are retried with
+    # backoff by the session's adapter; the loop only covers a 429 that is
+    # still returned once those retries are used up
+    attempt = 0
+    page = 1
+    while attempt < max_retries:
         try:
-            response = requests.get(endpoint, params=params, timeout=10)
+            response = _TRONGRID_SESSION.get(endpoint, params=params, timeout=10)
             
             if response.status_code == 429:
                 # Rate limited
                 retry_after = int(response.headers.get('Retry-After', 5))
                 logging.warning(f"Rate limited, waiting {retry_after}s...")
                 time.sleep(retry_after)
+                attempt += 1
                 continue
             
             if response.status_code != 200:
                 logging.error(f"TronGrid API error: {response.status_code} - {response.text}")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
-                    continue
                 return transfers
             
             data = response.json()
             
-            if 'data' in data:
-                for tx in data['data']:
-                    # Parse transfer event
-                    try:
-                        transfer = {
-                            'txid': tx['transaction_id'],
-                            'from_address': tx['from'],
-                            'to_address': tx['to'],
-                            'value_sun': int(tx['value']),
-                            'value_usdt': amount_from_sun(int(tx['value'])),
-                            'block_timestamp': tx['block_timestamp'],
-                            'contract_address': tx.get('token_info', {}).get('address', '')
-                        }
-                        transfers.append(transfer)
-                    except (KeyError, ValueError) as e:
-                        logging.warning(f"Failed to parse transfer: {e}")
-                        continue
+            append = transfers.append
+            for tx in data.get('data') or ():
+                # Parse transfer event
+                try:
+                    token_info = tx.get('token_info')
+                    append(Trc20Transfer(
+                        tx['transaction_id'],
+                        tx['from'],
+                        tx['to'],
+                        int(tx['value']),
+                        tx['block_timestamp'],
+                        token_info.get('address', '') if token_info else ''
+                    ))
+                except (KeyError, ValueError) as e:
+                    logging.warning(f"Failed to parse transfer: {e}")
+                    continue
             
-            return transfers
+            fingerprint = data.get('meta', {}).get('fingerprint')
+            if not fingerprint:
+                return transfers
+            if page >= TRONGRID_MAX_PAGES:
+                logging.warning(f"Stopped after {page} pages of transfers for {address}")
+                return transfers
+            
+            # Next page; the retry budget applies per page
+            params['fingerprint'] = fingerprint
+            page += 1
+            attempt = 0
             
         except requests.RequestException as e:
-            logging.error(f"Request error (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-                continue
+            logging.error(f"Request error (after retries): {e}")
             return transfers
         except Exception as e:
             logging.error(f"Unexpected error getting transfers: {e}")
@@ -239,47 +385,75 @@ def get_trc20_transfers_by_address(
 
 
 def validate_trc20_transfer(
-    transfer: Dict,
+    transfer: Trc20Transfer,
     expected_address: str,
     expected_amount: Decimal,
-    min_confirmations: int = TRON_MIN_CONFIRMATIONS
+    min_confirmations: int = TRON_MIN_CONFIRMATIONS,
+    confirmations: Optional[int] = None
 ) -> Tuple[bool, str]:
     """Validate a TRC20 transfer against expected criteria.
     
     Args:
-        transfer: Transfer data dict
+        transfer: Parsed transfer
         expected_address: Expected recipient address
         expected_amount: Expected transfer amount
         min_confirmations: Minimum required confirmations
+        confirmations: Already known confirmations; looked up when None
     
     Returns:
         Tuple of (is_valid, reason)
     """
+    reason = _check_transfer(
+        transfer,
+        normalize_address_to_base58(expected_address),
+        amount_to_sun(expected_amount)
+    )
+    if reason:
+        return False, reason
+    if confirmations is None:
+        confirmations = get_transaction_confirmations(transfer.txid)
+    return _check_confirmations(confirmations, min_confirmations)
+
+
+def _check_transfer(
+    transfer: Trc20Transfer,
+    expected_address: Optional[str],
+    expected_sun: int
+) -> Optional[str]:
+    """Field checks with pre-normalized expected address and sun amount.
+    
+    Returns:
+        The rejection reason, or None if the transfer passes
+    """
     # Check contract address
-    if transfer.get('contract_address') != USDT_CONTRACT:
-        return False, f"Wrong contract: {transfer.get('contract_address')}"
+    if transfer.contract_address != USDT_CONTRACT:
+        return f"Wrong contract: {transfer.contract_address}"
     
-    # Normalize and check recipient address
-    to_address = normalize_address_to_base58(transfer.get('to_address', ''))
-    expected_address = normalize_address_to_base58(expected_address)
+    # Normalize and check recipient address; TronGrid already returns Base58,
+    # so skip the cached normalizer (and its cache slots) in the common case
+    to_address = transfer.to_address
+    if not _is_base58_tron_addr(to_address):
+        to_address = normalize_address_to_base58(to_address)
     
     if not to_address or not expected_address:
-        return False, "Invalid address format"
+        return "Invalid address format"
     
     if to_address != expected_address:
-        return False, f"Wrong recipient: {to_address} != {expected_address}"
+        return f"Wrong recipient: {to_address} != {expected_address}"
     
-    # Check amount
-    transfer_amount = transfer.get('value_usdt', Decimal('0'))
-    if not amounts_match(transfer_amount, expected_amount):
-        return False, f"Amount mismatch: {transfer_amount} != {expected_amount}"
+    # Check amount (integer sun, no Decimal on the hot path)
+    transfer_sun = transfer.value_sun
+    if not amounts_match_sun(transfer_sun, expected_sun):
+        return f"Amount mismatch: {amount_from_sun(transfer_sun)} != {amount_from_sun(expected_sun)}"
     
-    # Check confirmations
-    txid = transfer.get('txid')
-    if not txid:
-        return False, "Missing TXID"
+    if not transfer.txid:
+        return "Missing TXID"
     
-    confirmations = get_transaction_confirmations(txid)
+    return None
+
+
+def _check_confirmations(confirmations: Optional[int], min_confirmations: int) -> Tuple[bool, str]:
+    """Confirmation check for validate_trc20_transfer."""
     if confirmations is None:
         return False, "Failed to get confirmations"
     
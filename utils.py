@@ -1,9 +1,16 @@
 import hashlib
+import hmac
 import urllib.parse
 import os
 import qrcode
 from PIL import Image, ImageDraw, ImageFont
 import io
+import threading
+import time
+from functools import lru_cache
+
+# 不参与签名的字段
+_EASYPAY_UNSIGNED = frozenset(('sign', 'sign_type'))
 
 def verify_easypay_sign(data: dict, key: str = None) -> bool:
     """
@@ -30,20 +37,16 @@ def verify_easypay_sign(data: dict, key: str = None) -> bool:
     if sign_type != 'MD5':
         return False
 
-    # 排除 sign 和 sign_type 字段
-    params = {k: v for k, v in data.items() if k not in ['sign', 'sign_type'] and v != ''}
-
-    # 排序并拼接参数
-    sign_str = '&'.join(f"{k}={params[k]}" for k in sorted(params))
-    sign_str += key
+    # 排除 sign 和 sign_type 字段，按键排序后一次拼接
+    items = sorted((k, v) for k, v in data.items() if k not in _EASYPAY_UNSIGNED and v != '')
+    sign_str = '&'.join(f"{k}={v}" for k, v in items) + key
 
-    # 生成 MD5 签名
-    md5 = hashlib.md5()
-    md5.update(sign_str.encode('utf-8'))
-    calculated_sign = md5.hexdigest()
+    # 生成 MD5 签名（hexdigest 本身即小写）
+    calculated_sign = hashlib.md5(sign_str.encode('utf-8')).hexdigest()
 
-    # 比较签名是否一致（不区分大小写）
-    return calculated_sign.lower() == original_sign.lower()
+    # 比较签名是否一致（不区分大小写，常量时间比较防止时序攻击；
+    # 按字节比较，非 ASCII 的伪造签名也不会抛异常）
+    return hmac.compare_digest(calculated_sign.encode(), str(original_sign).lower().encode('utf-8'))
 
 
 def create_easypay_url(pid: str, key: str, gateway_url: str,
@@ -62,7 +65,7 @@ def create_easypay_url(pid: str, key: str, gateway_url: str,
         "money": str(money)
     }
 
-    sign_str = '&'.join(f"{k}={params[k]}" for k in sorted(params))
+    sign_str = '&'.join(f"{k}={v}" for k, v in sorted(params.items()))
     sign = hashlib.md5((sign_str + key).encode('utf-8')).hexdigest()
     params["sign"] = sign
     params["sign_type"] = "MD5"
@@ -70,6 +73,69 @@ def create_easypay_url(pid: str, key: str, gateway_url: str,
     return f"{gateway_url}?{urllib.parse.urlencode(params)}"
 
 
+# 二维码图片尺寸与白色底图模板（每次生成时 copy，而不是重新 new）
+QR_IMG_WIDTH = 400
+QR_IMG_HEIGHT = 500
+_QR_TEMPLATE = Image.new('RGB', (QR_IMG_WIDTH, QR_IMG_HEIGHT), 'white')
+
+# 支付方式标题
+PAYMENT_NAMES = {
+    'wechat': '微信支付',
+    'alipay': '支付宝支付',
+    'wxpay': '微信支付'
+}
+
+
+@lru_cache(maxsize=1)
+def _get_qrcode_fonts():
+    """加载标题/信息字体，每个进程只解析一次字体文件"""
+    try:
+        # 尝试使用系统字体
+        if os.name == 'nt':  # Windows
+            font_title = ImageFont.truetype('msyh.ttc', 24)  # 微软雅黑
+            font_info = ImageFont.truetype('msyh.ttc', 16)
+        else:  # Linux/Mac
+            font_title = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 24)
+            font_info = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 16)
+    except:
+        # 如果系统字体不可用，使用默认字体
+        font_title = ImageFont.load_default()
+        font_info = ImageFont.load_default()
+    return font_title, font_info
+
+
+# 二维码磁盘缓存：同一组输入只生成一次；并发的相同请求按 key 加锁合并
+QR_DIR = "qr_codes"
+_qr_locks = {}
+_qr_locks_guard = threading.Lock()
+
+# 图片上画了订单号，每单一个文件；超过 QR_MAX_AGE 秒的旧图在生成新图时顺带清理（最多每 QR_CLEANUP_INTERVAL 秒一次）
+QR_MAX_AGE = int(os.getenv("QR_MAX_AGE", 24 * 3600))
+QR_CLEANUP_INTERVAL = 3600
+_qr_last_cleanup = 0.0
+
+
+def _cleanup_qr_dir():
+    """删除 qr_codes/ 下超过 QR_MAX_AGE 的二维码图片及残留临时文件"""
+    global _qr_last_cleanup
+    now = time.time()
+    with _qr_locks_guard:
+        if now - _qr_last_cleanup < QR_CLEANUP_INTERVAL:
+            return
+        _qr_last_cleanup = now
+    try:
+        entries = list(os.scandir(QR_DIR))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and now - entry.stat().st_mtime > QR_MAX_AGE:
+                os.remove(entry.path)
+        except OSError:
+            # 可能已被其它进程删除
+            pass
+
+
 def generate_payment_qrcode(payment_url: str, payment_type: str, amount: float, 
                            order_no: str, save_path: str = None) -> str:
     """
@@ -84,7 +150,39 @@ def generate_payment_qrcode(payment_url: str, payment_type: str, amount: float,
     
     返回:
         str，二维码图片文件路径
+    
+    不传 save_path 时按输入内容的哈希缓存在 qr_codes/ 下，已存在则直接返回
     """
+    if save_path is not None:
+        _render_payment_qrcode(payment_url, payment_type, amount, order_no).save(save_path)
+        return save_path
+    
+    key = hashlib.sha1(f"{payment_url}|{payment_type}|{amount}|{order_no}".encode()).hexdigest()[:16]
+    save_path = os.path.join(QR_DIR, f"{key}.png")
+    if os.path.exists(save_path):
+        return save_path
+    
+    with _qr_locks_guard:
+        lock = _qr_locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            # 等锁期间可能已由其它线程生成
+            if not os.path.exists(save_path):
+                os.makedirs(QR_DIR, exist_ok=True)
+                img = _render_payment_qrcode(payment_url, payment_type, amount, order_no)
+                # 先写临时文件再原子替换，避免读到半个文件
+                tmp_path = f"{save_path}.{threading.get_ident()}.tmp"
+                img.save(tmp_path, format='PNG')
+                os.replace(tmp_path, save_path)
+    finally:
+        with _qr_locks_guard:
+            _qr_locks.pop(key, None)
+    _cleanup_qr_dir()
+    return save_path
+
+
+def _render_payment_qrcode(payment_url: str, payment_type: str, amount: float, order_no: str):
+    """绘制支付二维码图片（标题、二维码、金额、订单号）"""
     # 创建二维码
     qr = qrcode.QRCode(
         version=1,
@@ -99,11 +197,11 @@ def generate_payment_qrcode(payment_url: str, payment_type: str, amount: float,
     qr_img = qr.make_image(fill_color="black", back_color="white")
     
     # 创建带标题的图片
-    img_width = 400
-    img_height = 500
+    img_width = QR_IMG_WIDTH
+    img_height = QR_IMG_HEIGHT
     
-    # 创建白色背景图片
-    img = Image.new('RGB', (img_width, img_height), 'white')
+    # 白色背景图片（复制模板）
+    img = _QR_TEMPLATE.copy()
     draw = ImageDraw.Draw(img)
     
     # 调整二维码大小
@@ -114,26 +212,10 @@ def generate_payment_qrcode(payment_url: str, payment_type: str, amount: float,
     qr_y = 80
     img.paste(qr_img, (qr_x, qr_y))
     
-    try:
-        # 尝试使用系统字体
-        if os.name == 'nt':  # Windows
-            font_title = ImageFont.truetype('msyh.ttc', 24)  # 微软雅黑
-            font_info = ImageFont.truetype('msyh.ttc', 16)
-        else:  # Linux/Mac
-            font_title = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 24)
-            font_info = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', 16)
-    except:
-        # 如果系统字体不可用，使用默认字体
-        font_title = ImageFont.load_default()
-        font_info = ImageFont.load_default()
+    font_title, font_info = _get_qrcode_fonts()
     
     # 支付方式标题
-    payment_names = {
-        'wechat': '微信支付',
-        'alipay': '支付宝支付',
-        'wxpay': '微信支付'
-    }
-    title = payment_names.get(payment_type, '扫码支付')
+    title = PAYMENT_NAMES.get(payment_type, '扫码支付')
     
     # 计算文字位置并绘制
     title_bbox = draw.textbbox((0, 0), title, font=font_title)
@@ -162,17 +244,7 @@ def generate_payment_qrcode(payment_url: str, payment_type: str, amount: float,
     tip_x = (img_width - tip_width) // 2
     draw.text((tip_x, 460), tip_text, fill='gray', font=font_info)
     
-    # 确定保存路径
-    if save_path is None:
-        # 创建 qr_codes 目录（如果不存在）
-        qr_dir = "qr_codes"
-        if not os.path.exists(qr_dir):
-            os.makedirs(qr_dir)
-        save_path = os.path.join(qr_dir, f"{payment_type}_{order_no}.png")
-    
-    # 保存图片
-    img.save(save_path)
-    return save_path
+    return img
 
 
 def create_payment_with_qrcode(pid: str, key: str, gateway_url: str,
@@ -10,15 +10,49 @@ Usage:
     python verify_startup.py
 """
 
+import ast
 import sys
 import os
 import logging
+import mmap
+from functools import lru_cache
 
 logging.basicConfig(
     format='[%(levelname)s] %(message)s',
     level=logging.INFO
 )
 
+@lru_cache(maxsize=None)
+def load_source(path):
+    """Read a source file once; every check shares the in-memory copy."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+@lru_cache(maxsize=None)
+def mapped_source(path):
+    """Memory-map a source file for byte substring scans without decoding it."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def source_contains(path, text):
+    """True if text occurs in the file (searched in the mapped bytes)."""
+    return mapped_source(path).find(text.encode('utf-8')) != -1
+
+
+@lru_cache(maxsize=None)
+def defined_functions(path):
+    """Names of all functions defined anywhere in a source file."""
+    tree = ast.parse(load_source(path), filename=path)
+    return frozenset(
+        node.name for node in ast.walk(tree)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+    )
+
+
 def check_environment():
     """Check environment variables."""
     print("\n" + "="*60)
@@ -79,29 +113,27 @@ def check_agent_handlers():
     print("AGENT HANDLER CHECK")
     print("="*60)
     
-    # Check if we can parse the bot_integration.py file
+    # Parse bot_integration.py and check the defined function names
     try:
-        with open('bot_integration.py', 'r', encoding='utf-8') as f:
-            content = f.read()
+        functions = defined_functions('bot_integration.py')
         
         handlers = [
-            'def agent_manage(',
-            'def agent_refresh(',
-            'def agent_new(',
-            'def agent_tgl(',
-            'def agent_del(',
-            'def agent_add(',
-            'def agent_toggle(',
-            'def agent_delete(',
-            'def integrate_agent_system('
+            'agent_manage',
+            'agent_refresh',
+            'agent_new',
+            'agent_tgl',
+            'agent_del',
+            'agent_add',
+            'agent_toggle',
+            'agent_delete',
+            'integrate_agent_system'
         ]
         
         for handler in handlers:
-            if handler in content:
-                handler_name = handler.split('(')[0].replace('def ', '')
-                print(f"✓ {handler_name}")
+            if handler in functions:
+                print(f"✓ {handler}")
             else:
-                print(f"❌ {handler.split('(')[0].replace('def ', '')} missing")
+                print(f"❌ {handler} missing")
                 return False
         
         print("\n✅ Agent handlers check passed")
@@ -119,8 +151,7 @@ def check_callback_patterns():
     print("="*60)
     
     try:
-        with open('bot_integration.py', 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = load_source('bot_integration.py')
         
         patterns = [
             "pattern='^agent_manage$'",
@@ -152,9 +183,6 @@ def check_bot_integration():
     print("="*60)
     
     try:
-        with open('bot.py', 'r', encoding='utf-8') as f:
-            content = f.read()
-        
         checks = [
             ('from bot_integration import', 'bot_integration module imported'),
             ('integrate_agent_system', 'integrate_agent_system called'),
@@ -162,7 +190,7 @@ def check_bot_integration():
         ]
         
         for check_str, description in checks:
-            if check_str in content:
+            if source_contains('bot.py', check_str):
                 print(f"✓ {description}")
             else:
                 print(f"❌ {description} missing")
@@ -183,9 +211,6 @@ def check_agent_creation_flow():
     print("="*60)
     
     try:
-        with open('bot.py', 'r', encoding='utf-8') as f:
-            content = f.read()
-        
         flow_steps = [
             ("sign == 'agent_add_token'", "Token input handler"),
             ("sign == 'agent_add_name'", "Name input handler"),
@@ -195,7 +220,7 @@ def check_agent_creation_flow():
         ]
         
         for check_str, description in flow_steps:
-            if check_str in content:
+            if source_contains('bot.py', check_str):
                 print(f"✓ {description}")
             else:
                 print(f"⚠ {description} - might be missing")
@@ -1,16 +1,27 @@
+import atexit
 import json
+import queue
 import time
 import itertools
 import logging
+import logging.handlers
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from dotenv import load_dotenv
 from tronpy.providers import HTTPProvider
 from tronpy import Tron
+from tronpy.keys import to_hex_address
 import tronpy.exceptions
 import pika
 from pika import exceptions
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # 加载环境变量
 load_dotenv()
 
@@ -20,13 +31,24 @@ def init_logging():
     os.makedirs(log_dir, exist_ok=True)
     log_path = os.path.join(log_dir, "zf.log")
     
+    # 文件/控制台输出交给后台线程，主循环里的 logging 只是一次入队，不阻塞在磁盘 I/O 上
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = logging.FileHandler(log_path, encoding='utf-8')
+    stream_handler = logging.StreamHandler()  # 同时输出到控制台
+    file_handler.setFormatter(formatter)
+    stream_handler.setFormatter(formatter)
+    
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)  # 退出前把队列里剩余的日志写完
+    
     logging.basicConfig(
         level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_path, encoding='utf-8'),
-            logging.StreamHandler()  # 同时输出到控制台
-        ]
+        format='%(message)s',
+        handlers=[logging.handlers.QueueHandler(log_queue)]
     )
     logging.info("🟢 zf_heijiang 启动成功")
 
@@ -34,12 +56,14 @@ init_logging()
 
 # ===== Tron APIKey 轮换机制 =====
 api_keys = os.getenv("TRON_API_KEYS", "").split(",")
-api_key_cycle = itertools.cycle(api_keys)
+# 每个 Key 只建一次客户端，复用其 HTTP 连接（keep-alive），轮换时不再重新握手
+tron_clients = [(key, Tron(HTTPProvider(api_key=key))) for key in api_keys]
+client_cycle = itertools.cycle(tron_clients)
 
 def get_tron_client():
-    current_key = next(api_key_cycle)
+    current_key, client = next(client_cycle)
     logging.info(f"🔁 使用 Tron API Key: {current_key[:6]}...")
-    return Tron(HTTPProvider(api_key=current_key))
+    return client
 
 # ===== RabbitMQ 连接 =====
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST")
@@ -49,42 +73,162 @@ RABBITMQ_PASS = os.getenv("RABBITMQ_PASS")
 RABBITMQ_VHOST = os.getenv("RABBITMQ_VHOST", "/")
 RABBITMQ_QUEUE = os.getenv("RABBITMQ_QUEUE", "telegram")
 
+# 区块序列化为 bytes：优先 orjson（C 实现，直接输出 bytes），不可用或遇到超范围整数时回退 json
+def dumps_bytes(obj) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(obj).encode()
+
+# 追块时合并推送：最多 32 个区块或 256KB 一条消息
+PUBLISH_BATCH_BLOCKS = 32
+PUBLISH_BATCH_BYTES = 256 * 1024
+PUBLISH_MAX_RETRIES = 5
+# 一批区块推送失败后，主循环等待多久再重试（秒）
+PUBLISH_RETRY_INTERVAL = 5
+
 credentials = pika.PlainCredentials(RABBITMQ_USER, RABBITMQ_PASS)
-connection = pika.BlockingConnection(pika.ConnectionParameters(
+# 心跳 30s 及时发现死连接；broker 阻塞（内存/磁盘告警）超过 60s 视为断开；socket 5s 超时
+connection_params = pika.ConnectionParameters(
     host=RABBITMQ_HOST,
     port=RABBITMQ_PORT,
     virtual_host=RABBITMQ_VHOST,
-    credentials=credentials
-))
-channel = connection.channel()
-channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
+    credentials=credentials,
+    heartbeat=30,
+    blocked_connection_timeout=60,
+    socket_timeout=5
+)
+
+class Publisher:
+    """持久的 MQ 推送器：首次推送时才建立连接，断线自动重连（指数退避），开启 publisher confirms，追块时合并推送"""
+
+    def __init__(self):
+        self.connection = None
+        self.channel = None
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_blocks = []
+        self._pending_bytes = 0
+
+    def _connect(self):
+        self.connection = pika.BlockingConnection(connection_params)
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue=RABBITMQ_QUEUE, durable=True)
+        # 开启确认：broker nack 时 basic_publish 抛出 NackError
+        self.channel.confirm_delivery()
+
+    def _close(self):
+        try:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+        self.channel = None
+
+    def keepalive(self):
+        """空闲时处理一次 IO，让心跳在长时间无推送时也能收发"""
+        with self._lock:
+            if self.connection is None or not self.connection.is_open:
+                return
+            try:
+                self.connection.process_data_events(time_limit=0)
+            except pika.exceptions.AMQPError as e:
+                logging.warning(f"🔌 MQ 连接已断开：{e}，下次推送时重连")
+                self._close()
+
+    def publish(self, body: bytes) -> bool:
+        with self._lock:
+            return self._publish(body)
+
+    def _publish(self, body: bytes) -> bool:
+        delay = 1
+        for attempt in range(1, PUBLISH_MAX_RETRIES + 1):
+            try:
+                if self.channel is None or self.channel.is_closed:
+                    self._connect()
+                self.channel.basic_publish(exchange='', routing_key=RABBITMQ_QUEUE, body=body)
+                return True
+            except (pika.exceptions.NackError, pika.exceptions.UnroutableError) as e:
+                logging.error(f"❌ MQ 拒绝消息：{e}")
+                return False
+            except (pika.exceptions.AMQPConnectionError,
+                    pika.exceptions.AMQPChannelError,
+                    pika.exceptions.ChannelWrongStateError,
+                    pika.exceptions.StreamLostError) as e:
+                logging.warning(f"🔌 MQ 连接异常（第 {attempt} 次）：{e}，{delay}s 后重连")
+                self._close()
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+        logging.error(f"❌ MQ 推送失败：重试 {PUBLISH_MAX_RETRIES} 次仍未成功")
+        return False
+
+    def add(self, block_data, block):
+        """缓存一个区块，攒满一批后自动推送"""
+        message = dumps_bytes(block_data)
+        self._pending.append(message)
+        self._pending_blocks.append(block)
+        self._pending_bytes += len(message)
+        if len(self._pending) >= PUBLISH_BATCH_BLOCKS or self._pending_bytes >= PUBLISH_BATCH_BYTES:
+            self.flush()
+
+    def flush(self) -> bool:
+        """推送缓存的区块：单个区块保持 {"block_list": ...}，多个合并为 {"block_lists": [...]}
+
+        推送成功才清空缓存；失败时保留整批，返回 False，由调用方稍后重试
+        """
+        if not self._pending:
+            return True
+        if len(self._pending) == 1:
+            body = b'{"block_list": ' + self._pending[0] + b'}'
+        else:
+            body = b'{"block_lists": [' + b', '.join(self._pending) + b']}'
+        blocks = self._pending_blocks
+        if not self.publish(body):
+            logging.warning(f"⚠️ 区块 {blocks[0]}-{blocks[-1]}（{len(blocks)} 个）推送失败，保留待重试")
+            return False
+        self._pending = []
+        self._pending_blocks = []
+        self._pending_bytes = 0
+        if len(blocks) == 1:
+            logging.info(f"✅ 推送区块 {blocks[0]} 到 MQ 成功")
+        else:
+            logging.info(f"✅ 合并推送区块 {blocks[0]}-{blocks[-1]}（{len(blocks)} 个）到 MQ 成功")
+        return True
+
+publisher = Publisher()
 
 # ===== 推送区块数据到 MQ =====
 def send_to_rabbitmq(block_data, block):
+    publisher.add(block_data, block)
+    publisher.flush()
+
+# 下游 jxqk 只关心 USDT 合约调用，推送前先过滤掉其它交易
+USDT_CONTRACT = os.getenv('USDT_CONTRACT', 'TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t')
+# tronpy 的 get_block 默认 visible=True 返回 Base58 地址，非 visible 节点返回 41 开头的 hex，两种都认
+USDT_CONTRACT_FORMS = frozenset({USDT_CONTRACT, to_hex_address(USDT_CONTRACT)})
+
+def is_usdt_call(trx) -> bool:
     try:
-        message = json.dumps({"block_list": block_data})
-        channel.basic_publish(
-            exchange='',
-            routing_key=RABBITMQ_QUEUE,
-            body=message.encode()
-        )
-        logging.info(f"✅ 推送区块 {block} 到 MQ 成功")
-    except pika.exceptions.AMQPError as e:
-        logging.error(f"❌ MQ 推送失败：{e}")
+        contract = trx['raw_data']['contract'][0]
+        return (contract['type'] == 'TriggerSmartContract'
+                and contract['parameter']['value'].get('contract_address') in USDT_CONTRACT_FORMS)
+    except (KeyError, IndexError, TypeError):
+        return False
 
-# ===== 获取区块并推送到 MQ =====
-def get_data(block) -> None:
+# 追块时并发预取的区块数（每个请求由轮换的 Key 分担）
+PREFETCH_BLOCKS = int(os.getenv("ZF_PREFETCH_BLOCKS", 8))
+
+# ===== 拉取区块（可在线程池中并发执行） =====
+def fetch_block(block):
+    """拉取单个区块，失败重试 5 次后返回 None"""
     retry = 0
     while retry < 5:
         try:
             client = get_tron_client()
-            block_data = client.get_block(block)
-
-            if 'transactions' in block_data and block_data['transactions']:
-                send_to_rabbitmq(block_data, block)
-            else:
-                logging.info(f"⏩ 区块 {block} 无交易，跳过")
-            return
+            return client.get_block(block)
 
         except tronpy.exceptions.BlockNotFound:
             logging.warning(f"⏳ 区块未生成：{block}，等待中...")
@@ -97,13 +241,50 @@ def get_data(block) -> None:
             logging.exception(f"❌ 区块 {block} 拉取异常")
             retry += 1
             time.sleep(2)
+    return None
+
+# ===== 推送已拉取的区块（MQ 连接非线程安全，只在主线程调用） =====
+def publish_block(block_data, block) -> None:
+    if block_data is None:
+        return
+    transactions = [trx for trx in block_data.get('transactions') or () if is_usdt_call(trx)]
+    if transactions:
+        block_data['transactions'] = transactions
+        publisher.add(block_data, block)
+    else:
+        logging.info(f"⏩ 区块 {block} 无 USDT 交易，跳过")
+
+# ===== 获取区块并推送到 MQ =====
+def get_data(block) -> None:
+    publish_block(fetch_block(block), block)
+    publisher.flush()
+
+def get_latest_block_number():
+    try:
+        return get_tron_client().get_latest_block_number()
+    except Exception as e:
+        logging.warning(f"🌐 获取最新区块失败：{e}")
+        return None
 
 # ===== 主循环 =====
 if __name__ == '__main__':
     client = get_tron_client()
     block = client.get_latest_block()['block_header']['raw_data']['number'] - 1
 
-    while True:
-        get_data(block)
-        block += 1
-        time.sleep(1)
+    # 落后时一次并发预取多个区块；executor.map 按提交顺序返回结果，保证推送顺序
+    with ThreadPoolExecutor(max_workers=PREFETCH_BLOCKS) as executor:
+        while True:
+            latest = get_latest_block_number()
+            if latest is None or block > latest:
+                publisher.keepalive()
+                time.sleep(1)
+                continue
+
+            end = min(block + PREFETCH_BLOCKS, latest + 1)
+            blocks = range(block, end)
+            for b, block_data in zip(blocks, executor.map(fetch_block, blocks)):
+                publish_block(block_data, b)
+            # 这批区块全部推送成功后才前进，MQ 不可用时原地重试，不丢区块
+            while not publisher.flush():
+                time.sleep(PUBLISH_RETRY_INTERVAL)
+            block = end